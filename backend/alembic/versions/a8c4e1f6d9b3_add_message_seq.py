@@ -0,0 +1,39 @@
+"""add per-match message sequence numbers
+
+Revision ID: a8c4e1f6d9b3
+Revises: f1d3b7e9a2c5
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c4e1f6d9b3'
+down_revision: Union[str, None] = 'f1d3b7e9a2c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('messages', sa.Column('seq', sa.BigInteger(), nullable=True))
+    # Number existing history in send order, per match
+    op.execute("""
+        UPDATE messages m
+        SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY match_id ORDER BY created_at, id) AS seq
+            FROM messages
+        ) AS numbered
+        WHERE m.id = numbered.id
+    """)
+    op.alter_column('messages', 'seq', nullable=False)
+    op.create_index('uq_messages_match_seq', 'messages', ['match_id', 'seq'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_messages_match_seq', table_name='messages')
+    op.drop_column('messages', 'seq')
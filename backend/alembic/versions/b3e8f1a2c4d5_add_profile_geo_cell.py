@@ -0,0 +1,38 @@
+"""add profile geo cell
+
+Revision ID: b3e8f1a2c4d5
+Revises: 10c6f7hh8532
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8f1a2c4d5'
+down_revision: Union[str, None] = '10c6f7hh8532'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('profiles', sa.Column('geo_cell', sa.Integer(), nullable=True))
+    op.create_index('ix_profiles_geo_cell_gender', 'profiles', ['geo_cell', 'gender'], unique=False)
+
+    # Backfill using the grid from utils/location.py at the time of writing:
+    # 0.01 degree cells over lat 18.25-18.85 (60 rows), long 73.55-74.25 (70 cols), edges clamped
+    op.execute("""
+        UPDATE profiles
+        SET geo_cell =
+            LEAST(GREATEST(FLOOR((latitude - 18.25) / 0.01), 0), 59)::int * 70
+            + LEAST(GREATEST(FLOOR((longitude - 73.55) / 0.01), 0), 69)::int
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_profiles_geo_cell_gender', table_name='profiles')
+    op.drop_column('profiles', 'geo_cell')
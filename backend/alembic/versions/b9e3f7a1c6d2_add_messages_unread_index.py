@@ -0,0 +1,29 @@
+"""add partial index over unread messages
+
+Revision ID: b9e3f7a1c6d2
+Revises: a8c4e1f6d9b3
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9e3f7a1c6d2'
+down_revision: Union[str, None] = 'a8c4e1f6d9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_messages_match_unread', 'messages', ['match_id', 'seq'],
+        postgresql_where=sa.text('is_read = false'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_match_unread', table_name='messages')
@@ -0,0 +1,66 @@
+"""unique likes and canonical match pairs
+
+Revision ID: c4f9a2b7d1e6
+Revises: b3e8f1a2c4d5
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f9a2b7d1e6'
+down_revision: Union[str, None] = 'b3e8f1a2c4d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Drop duplicate likes left by the old check-then-insert path, keeping the earliest
+    op.execute("""
+        DELETE FROM likes l
+        USING likes keep
+        WHERE l.from_user_id = keep.from_user_id
+          AND l.to_user_id = keep.to_user_id
+          AND (keep.created_at, keep.id) < (l.created_at, l.id)
+    """)
+    op.create_unique_constraint('uq_likes_from_to', 'likes', ['from_user_id', 'to_user_id'])
+
+    # Store every match with the smaller user id first
+    op.execute("""
+        UPDATE matches
+        SET user1_id = user2_id, user2_id = user1_id
+        WHERE user1_id > user2_id
+    """)
+    # Collapse duplicate matches created by racing mutual likes onto the earliest one,
+    # moving their messages over first
+    op.execute("""
+        WITH ranked AS (
+            SELECT id,
+                   first_value(id) OVER (
+                       PARTITION BY user1_id, user2_id ORDER BY created_at, id
+                   ) AS keep_id
+            FROM matches
+        )
+        UPDATE messages m
+        SET match_id = ranked.keep_id
+        FROM ranked
+        WHERE m.match_id = ranked.id AND ranked.id <> ranked.keep_id
+    """)
+    op.execute("""
+        DELETE FROM matches m
+        USING matches keep
+        WHERE m.user1_id = keep.user1_id
+          AND m.user2_id = keep.user2_id
+          AND (keep.created_at, keep.id) < (m.created_at, m.id)
+    """)
+    op.create_unique_constraint('uq_matches_pair', 'matches', ['user1_id', 'user2_id'])
+    op.create_check_constraint('ck_matches_pair_order', 'matches', 'user1_id < user2_id')
+
+
+def downgrade() -> None:
+    op.drop_constraint('ck_matches_pair_order', 'matches', type_='check')
+    op.drop_constraint('uq_matches_pair', 'matches', type_='unique')
+    op.drop_constraint('uq_likes_from_to', 'likes', type_='unique')
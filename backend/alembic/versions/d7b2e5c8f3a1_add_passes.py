@@ -0,0 +1,38 @@
+"""add passes
+
+Revision ID: d7b2e5c8f3a1
+Revises: c4f9a2b7d1e6
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7b2e5c8f3a1'
+down_revision: Union[str, None] = 'c4f9a2b7d1e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('passes',
+    sa.Column('from_user_id', sa.UUID(), nullable=False),
+    sa.Column('to_user_id', sa.UUID(), nullable=False),
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['from_user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['to_user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('from_user_id', 'to_user_id', name='uq_passes_from_to')
+    )
+    op.create_index(op.f('ix_passes_from_user_id'), 'passes', ['from_user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_passes_from_user_id'), table_name='passes')
+    op.drop_table('passes')
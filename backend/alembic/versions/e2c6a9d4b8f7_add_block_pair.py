@@ -0,0 +1,39 @@
+"""add canonical block pair
+
+Revision ID: e2c6a9d4b8f7
+Revises: d7b2e5c8f3a1
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c6a9d4b8f7'
+down_revision: Union[str, None] = 'd7b2e5c8f3a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('blocks', sa.Column('user_low_id', sa.UUID(), sa.Computed('LEAST(blocker_id, blocked_id)', persisted=True), nullable=True))
+    op.add_column('blocks', sa.Column('user_high_id', sa.UUID(), sa.Computed('GREATEST(blocker_id, blocked_id)', persisted=True), nullable=True))
+
+    # Keep only the earliest block per pair (duplicates and mutual blocks collapse into one)
+    op.execute("""
+        DELETE FROM blocks b
+        USING blocks keep
+        WHERE b.user_low_id = keep.user_low_id
+          AND b.user_high_id = keep.user_high_id
+          AND (keep.created_at, keep.id) < (b.created_at, b.id)
+    """)
+    op.create_unique_constraint('uq_blocks_pair', 'blocks', ['user_low_id', 'user_high_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_blocks_pair', 'blocks', type_='unique')
+    op.drop_column('blocks', 'user_high_id')
+    op.drop_column('blocks', 'user_low_id')
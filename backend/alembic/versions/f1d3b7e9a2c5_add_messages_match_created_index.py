@@ -0,0 +1,28 @@
+"""add messages (match_id, created_at, id) index
+
+Revision ID: f1d3b7e9a2c5
+Revises: e2c6a9d4b8f7
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1d3b7e9a2c5'
+down_revision: Union[str, None] = 'e2c6a9d4b8f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_messages_match_created_id', 'messages', ['match_id', 'created_at', 'id'], unique=False)
+    # The composite index's leading column covers every lookup the old one served
+    op.drop_index('ix_messages_match_id', table_name='messages')
+
+
+def downgrade() -> None:
+    op.create_index('ix_messages_match_id', 'messages', ['match_id'], unique=False)
+    op.drop_index('ix_messages_match_created_id', table_name='messages')
@@ -1,13 +1,90 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
 import redis.asyncio as aioredis
 from config.settings import settings
 
-async def get_redis_pool():
+# Single process-wide client. Created by the FastAPI lifespan hook (see main.py)
+# and shared by every request, WebSocket and background task in this worker.
+_redis_client: Optional[aioredis.Redis] = None
+
+def _build_redis_url() -> str:
     # Render/Upstash secure Redis typically needs `rediss://` (with 2 s's for TLS)
     protocol = "rediss://" if "upstash.io" in settings.REDIS_HOST else "redis://"
     auth = f":{settings.REDIS_PASSWORD}@" if settings.REDIS_PASSWORD else ""
-    redis_url = f"{protocol}{auth}{settings.REDIS_HOST}:{settings.REDIS_PORT}"
-    
-    pool = aioredis.ConnectionPool.from_url(
-        redis_url, encoding="utf8", decode_responses=True
-    )
-    return aioredis.Redis(connection_pool=pool)
+    return f"{protocol}{auth}{settings.REDIS_HOST}:{settings.REDIS_PORT}"
+
+async def init_redis() -> aioredis.Redis:
+    """
+    Creates the shared Redis client if it doesn't exist yet.
+    Uses a blocking pool so bursts wait for a free connection instead of erroring out.
+    """
+    global _redis_client
+    if _redis_client is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            _build_redis_url(),
+            encoding="utf8",
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+        )
+        _redis_client = aioredis.Redis(connection_pool=pool)
+    return _redis_client
+
+async def close_redis() -> None:
+    global _redis_client
+    if _redis_client is not None:
+        client = _redis_client
+        _redis_client = None
+        await client.aclose()
+        await client.connection_pool.disconnect()
+
+async def get_redis_pool() -> aioredis.Redis:
+    # Returns the shared client. Falls back to lazy creation for scripts and
+    # code paths that run outside the app lifespan (e.g. standalone cron runs).
+    return await init_redis()
+
+async def run_subscriber(channel: str, handler: Callable[[str], Awaitable[None]]) -> None:
+    """
+    Long-running pub/sub listener for a single channel.
+    Reconnects with a short pause if Redis drops; meant to be run as a lifespan task.
+    """
+    while True:
+        try:
+            redis = await get_redis_pool()
+            pubsub = redis.pubsub()
+            await pubsub.subscribe(channel)
+            try:
+                while True:
+                    # Short poll timeout so the pool's socket_timeout never trips on idle channels
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message:
+                        await handler(message["data"])
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Redis subscriber error on {channel}: {e}")
+            await asyncio.sleep(1)
+
+def get_redis_pool_stats() -> dict:
+    """
+    Snapshot of the shared connection pool for monitoring.
+    """
+    if _redis_client is None:
+        return {"initialized": False}
+
+    pool = _redis_client.connection_pool
+    in_use = len(pool._in_use_connections)
+    idle = len(pool._available_connections)
+    return {
+        "initialized": True,
+        "max_connections": pool.max_connections,
+        "created_connections": in_use + idle,
+        "in_use_connections": in_use,
+        "idle_connections": idle,
+    }
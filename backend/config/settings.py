@@ -19,6 +19,58 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "redis"
     REDIS_PORT: str = "6379"
     REDIS_PASSWORD: Optional[str] = None
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 5
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 5.0
+
+    # Per-worker cache of authenticated users (see services/user_cache.py)
+    USER_CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 60
+
+    # Per-worker cache of block lookups between two users (see services/block_service.py)
+    BLOCK_CACHE_MAX_SIZE: int = 50000
+    BLOCK_CACHE_TTL_SECONDS: int = 300
+
+    # Precomputed discover candidate queues (see services/discover_queue.py)
+    DISCOVER_QUEUE_SIZE: int = 200
+    DISCOVER_QUEUE_WATERMARK: int = 40
+    DISCOVER_QUEUE_TTL_SECONDS: int = 900
+    DISCOVER_EXCLUSION_TTL_SECONDS: int = 86400
+
+    # Local revoked-token mirror (see services/token_revocation.py)
+    TOKEN_REVOCATION_SYNC_INTERVAL: int = 30
+    TOKEN_REVOCATION_MAX_STALENESS: int = 90
+    # "open" accepts tokens when revocation state is unknown, "closed" rejects them with 503
+    TOKEN_REVOCATION_FAIL_MODE: str = "open"
+
+    # Write-behind chat message persistence (see services/message_writer.py)
+    CHAT_WRITE_BATCH_SIZE: int = 200
+    CHAT_WRITE_FLUSH_INTERVAL: float = 0.05
+    CHAT_WRITE_MAX_PENDING: int = 10000
+    # "buffered" acknowledges before the insert, "flush" waits for the batch commit
+    CHAT_WRITE_DURABILITY: str = "buffered"
+    # Longest a "flush" send waits for its commit before failing so the client can retry
+    CHAT_WRITE_FLUSH_TIMEOUT: float = 5.0
+
+    # Per-socket outbound queues and heartbeats (see ConnectionManager in services/chat_service.py)
+    CHAT_OUTBOUND_QUEUE_SIZE: int = 256
+    CHAT_SEND_TIMEOUT: float = 10.0
+    CHAT_HEARTBEAT_INTERVAL: float = 25.0
+    CHAT_HEARTBEAT_TIMEOUT: float = 75.0
+
+    # Chat messages per user per window, checked per socket locally and per user
+    # across nodes (see services/rate_limiter.py)
+    CHAT_RATE_LIMIT_MESSAGES: int = 30
+    CHAT_RATE_LIMIT_WINDOW: int = 60
+
+    # Newest messages per match kept in Redis for opening a chat (see services/recent_messages.py)
+    CHAT_RECENT_CACHE_SIZE: int = 100
+    CHAT_RECENT_CACHE_TTL_SECONDS: int = 3600
+
+    # Per-IP HTTP limits in middleware/rate_limit.py
+    RATE_LIMIT_ENABLED: bool = False
     
     # Auth
     SECRET_KEY: str = "replace_me_with_a_secure_random_string_in_production"
@@ -26,6 +78,10 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 120
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     FRONTEND_URL: str = "http://localhost:3000"
+
+    # bcrypt runs in a bounded thread pool; requests beyond workers + queue limit get a 503
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_LIMIT: int = 32
     
     # Location bounds for Pune, India
     PUNE_LAT_MIN: float = 18.25
@@ -9,15 +9,44 @@ from fastapi.staticfiles import StaticFiles
 import os
 
 from contextlib import asynccontextmanager
-from tasks.cron import start_scheduler
+from tasks.cron import start_scheduler, flush_daily_activity
+from config.redis import init_redis, close_redis
+from services.user_cache import user_cache
+from services.block_service import block_cache
+from services.chat_service import manager as chat_manager
+from services.message_writer import message_writer
+from services.token_revocation import revocation_list
+import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Startup: Shared Redis client for the whole worker
+    await init_redis()
+    print("[INIT] Shared Redis connection pool created.")
+
+    # Startup: Cross-worker listeners (user/block cache invalidation, token revocation mirror, chat fan-out)
+    background_listeners = [
+        asyncio.create_task(user_cache.listen()),
+        asyncio.create_task(block_cache.listen()),
+        asyncio.create_task(chat_manager.listen()),
+        asyncio.create_task(chat_manager.heartbeat()),
+        asyncio.create_task(message_writer.run()),
+        asyncio.create_task(revocation_list.listen()),
+        asyncio.create_task(revocation_list.sync_forever()),
+    ]
+
     # Startup: Start APScheduler
     start_scheduler()
     print("[INIT] Compatibility Scoring APScheduler configured.")
     yield
-    # Shutdown logic goes here if needed
+    # Shutdown: stop background listeners, then release pooled Redis connections
+    for task in background_listeners:
+        task.cancel()
+    # Shutdown: persist chat messages still buffered
+    await message_writer.close()
+    # Shutdown: apply any streak activity still queued
+    await flush_daily_activity()
+    await close_redis()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -40,6 +69,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Security, Logging, and Rate limiting
@@ -1,8 +1,8 @@
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
-import time
-from config.redis import get_redis_pool
+from config.settings import settings
+from services.rate_limiter import rate_limiter
 
 # Basic rate limit settings: 100 requests per minute per IP
 RATE_LIMIT_REQUESTS = 100
@@ -10,8 +10,9 @@ RATE_LIMIT_WINDOW = 60
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        # TEMPORARILY BYPASSED TO UNBLOCK USER
-        return await call_next(request)
+        # Was bypassed outright to unblock a user; now opt-in via RATE_LIMIT_ENABLED
+        if not settings.RATE_LIMIT_ENABLED:
+            return await call_next(request)
             
         # Dynamic limits based on path
         is_login = request.url.path.endswith("/auth/login")
@@ -25,28 +26,14 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             client_ip = request.client.host if request.client else "unknown"
 
         try:
-            redis = await get_redis_pool()
-            
-            current_time = int(time.time())
-            window_start = current_time - limit_window
-            
             key_prefix = "rate_limit_login" if is_login else "rate_limit"
-            key = f"{key_prefix}:{client_ip}"
-            
-            # We use a sorted set to count requests in the rolling window
-            async with redis.pipeline(transaction=True) as pipe:
-                pipe.zremrangebyscore(key, 0, window_start) # clean old requests
-                pipe.zcard(key) # count current requests
-                pipe.zadd(key, {str(current_time): current_time})
-                pipe.expire(key, limit_window)
-                results = await pipe.execute()
-                
-            request_count = results[1]
+            result = await rate_limiter.hit(f"{key_prefix}:{client_ip}", limit_requests, limit_window)
             
-            if request_count >= limit_requests:
+            if not result.allowed:
                 return JSONResponse(
                     status_code=429,
-                    content={"detail": "Too many requests. Please try again later."}
+                    content={"detail": "Too many requests. Please try again later."},
+                    headers={"Retry-After": str(max(int(result.retry_after + 0.999), 1))},
                 )
         except Exception as e:
             # If Redis connection fails, we shouldn't completely crash the whole app.
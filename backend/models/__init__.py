@@ -4,6 +4,7 @@ from models.profile import Profile
 from models.photo import Photo
 from models.prompt import Prompt
 from models.like import Like
+from models.user_pass import UserPass
 from models.match import Match
 from models.message import Message
 from models.report import Report, ReportStatus
@@ -17,7 +18,7 @@ __all__ = [
     "Base", "BaseModel",
     "User", "UserRole",
     "Profile", "Photo", "Prompt",
-    "Like", "Match", "Message",
+    "Like", "UserPass", "Match", "Message",
     "Report", "ReportStatus",
     "Block", "AdminAction", "UserActivity",
     "UserStreak"
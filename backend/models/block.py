@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Computed, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from models.base import BaseModel
 from sqlalchemy.dialects.postgresql import UUID
@@ -6,9 +6,14 @@ import uuid
 
 class Block(BaseModel):
     __tablename__ = "blocks"
+    # At most one block per pair of users, whichever direction it was made in
+    __table_args__ = (UniqueConstraint("user_low_id", "user_high_id", name="uq_blocks_pair"),)
 
     blocker_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
     blocked_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    # Canonical (smaller, larger) ordering of the pair, maintained by Postgres
+    user_low_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), Computed("LEAST(blocker_id, blocked_id)", persisted=True))
+    user_high_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), Computed("GREATEST(blocker_id, blocked_id)", persisted=True))
 
     blocker = relationship("User", foreign_keys=[blocker_id])
     blocked = relationship("User", foreign_keys=[blocked_id])
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Boolean
+from sqlalchemy import ForeignKey, Boolean, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from models.base import BaseModel
 from sqlalchemy.dialects.postgresql import UUID
@@ -6,6 +6,7 @@ import uuid
 
 class Like(BaseModel):
     __tablename__ = "likes"
+    __table_args__ = (UniqueConstraint("from_user_id", "to_user_id", name="uq_likes_from_to"),)
 
     from_user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
     to_user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
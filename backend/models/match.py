@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Boolean, Integer
+from sqlalchemy import ForeignKey, Boolean, Integer, UniqueConstraint, CheckConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from models.base import BaseModel
 from sqlalchemy.dialects.postgresql import UUID
@@ -6,6 +6,11 @@ import uuid
 
 class Match(BaseModel):
     __tablename__ = "matches"
+    # One match per pair, stored canonically with the smaller user id first
+    __table_args__ = (
+        UniqueConstraint("user1_id", "user2_id", name="uq_matches_pair"),
+        CheckConstraint("user1_id < user2_id", name="ck_matches_pair_order"),
+    )
 
     user1_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
     user2_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, String, Boolean
+from sqlalchemy import ForeignKey, String, Boolean, Index, BigInteger, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from models.base import BaseModel
 from sqlalchemy.dialects.postgresql import UUID
@@ -6,10 +6,19 @@ import uuid
 
 class Message(BaseModel):
     __tablename__ = "messages"
+    # History reads walk one match's messages in (created_at, id) order
+    __table_args__ = (
+        Index("ix_messages_match_created_id", "match_id", "created_at", "id"),
+        Index("uq_messages_match_seq", "match_id", "seq", unique=True),
+        # Only unread messages: mark-read updates and unread counts skip read history
+        Index("ix_messages_match_unread", "match_id", "seq", postgresql_where=text("is_read = false")),
+    )
 
-    match_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("matches.id", ondelete="CASCADE"), index=True)
+    match_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("matches.id", ondelete="CASCADE"))
     sender_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
     content: Mapped[str] = mapped_column(String)
+    # Per-match, gapless and increasing in send order; clients resume sync from it
+    seq: Mapped[int] = mapped_column(BigInteger)
     is_read: Mapped[bool] = mapped_column(Boolean, default=False)
 
     match = relationship("Match", back_populates="messages")
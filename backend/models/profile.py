@@ -1,4 +1,4 @@
-from sqlalchemy import String, Float, ForeignKey, Date, Text
+from sqlalchemy import String, Float, ForeignKey, Date, Text, Integer, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from models.base import BaseModel
 from sqlalchemy.dialects.postgresql import UUID, JSONB
@@ -7,6 +7,10 @@ import datetime
 
 class Profile(BaseModel):
     __tablename__ = "profiles"
+    __table_args__ = (
+        # Discover scans nearby grid cells for a wanted gender
+        Index("ix_profiles_geo_cell_gender", "geo_cell", "gender"),
+    )
 
     user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), unique=True)
     first_name: Mapped[str] = mapped_column(String(50))
@@ -20,6 +24,8 @@ class Profile(BaseModel):
     # Location tracking
     latitude: Mapped[float] = mapped_column(Float, nullable=True)
     longitude: Mapped[float] = mapped_column(Float, nullable=True)
+    # Spatial grid cell derived from latitude/longitude (see utils/location.py)
+    geo_cell: Mapped[int] = mapped_column(Integer, nullable=True)
 
     # Feature Vectors
     interests: Mapped[list[str]] = mapped_column(JSONB, default=list, nullable=True)
@@ -0,0 +1,18 @@
+from sqlalchemy import ForeignKey, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from models.base import BaseModel
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+
+class UserPass(BaseModel):
+    """
+    A left swipe. Recorded so the passed user stays out of discover.
+    """
+    __tablename__ = "passes"
+    __table_args__ = (UniqueConstraint("from_user_id", "to_user_id", name="uq_passes_from_to"),)
+
+    from_user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    to_user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
+
+    from_user = relationship("User", foreign_keys=[from_user_id])
+    to_user = relationship("User", foreign_keys=[to_user_id])
@@ -13,6 +13,16 @@ from schemas.admin import (
 )
 from services.admin_service import AdminService
 from models.report import ReportStatus
+from config.redis import get_redis_pool_stats
+from services.user_cache import user_cache
+from services.block_service import block_cache
+from services.chat_service import manager as chat_manager
+from services.message_writer import message_writer
+from services.token_revocation import revocation_list
+from utils.security import get_password_hash_stats
+from services.exclusion_filter import exclusion_stats
+from services.rate_limiter import rate_limit_stats
+from services.recent_messages import recent_messages_stats
 
 router = APIRouter()
 
@@ -67,6 +77,22 @@ async def get_statistics(
     admin_service = AdminService(db)
     return await admin_service.get_statistics()
 
+@router.get("/metrics")
+async def get_runtime_metrics(current_admin: User = Depends(get_current_admin)):
+    # Per-worker runtime stats (each uvicorn worker reports its own pools)
+    return {
+        "redis_pool": get_redis_pool_stats(),
+        "user_cache": user_cache.stats(),
+        "block_cache": block_cache.stats(),
+        "chat_connections": chat_manager.stats(),
+        "chat_message_writer": message_writer.stats(),
+        "token_revocation": revocation_list.stats(),
+        "password_hashing": get_password_hash_stats(),
+        "discover_exclusion": dict(exclusion_stats),
+        "rate_limits": dict(rate_limit_stats),
+        "chat_recent_messages": dict(recent_messages_stats),
+    }
+
 @router.get("/users", response_model=PaginatedResponse[AdminUserResponse])
 async def get_all_users(
     page: int = Query(1, ge=1),
@@ -4,13 +4,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from config.database import get_db
-from config.redis import get_redis_pool
+from services.token_revocation import revocation_list
 from config.settings import settings
 from schemas.user import UserCreate, UserResponse
 from schemas.token import Token, RefreshTokenRequest, LogoutRequest
 from services.user_service import UserService
+from services.user_cache import user_cache
 from routes.dependencies import get_current_user, oauth2_scheme
-from utils.security import verify_password, create_access_token, create_refresh_token
+from utils.security import verify_password_async, create_access_token, create_refresh_token
 from jose import jwt, JWTError
 from models.user import User, UserRole
 import httpx
@@ -28,7 +29,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     user_service = UserService(db)
     user = await user_service.get_user_by_email(form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -98,6 +99,7 @@ async def google_callback(request: __import__('schemas').user.GoogleAuthRequest,
     elif not user.is_active:
         user.is_active = True
         await db.commit()
+        await user_cache.invalidate(user.id)
         
     access_token = create_access_token(subject=user.id, role=user.role.value)
     refresh_token = create_refresh_token(subject=user.id, role=user.role.value)
@@ -121,8 +123,7 @@ async def refresh_token(request: RefreshTokenRequest, db: AsyncSession = Depends
             raise credentials_exception
             
         # Check if refresh token is blacklisted
-        redis = await get_redis_pool()
-        if await redis.get(f"bl:{jti}"):
+        if await revocation_list.is_revoked(jti):
             raise credentials_exception
             
     except JWTError:
@@ -134,7 +135,7 @@ async def refresh_token(request: RefreshTokenRequest, db: AsyncSession = Depends
         raise credentials_exception
         
     # Optional: Rotate the refresh token (blacklist old one and issue a new one)
-    # await redis.setex(f"bl:{jti}", settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, "1")
+    # await revocation_list.revoke(jti, settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400)
     
     new_access_token = create_access_token(subject=user.id, role=user.role.value)
     new_refresh_token = create_refresh_token(subject=user.id, role=user.role.value)
@@ -148,8 +149,6 @@ async def logout(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        redis = await get_redis_pool()
-        
         # Blacklist Access Token
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -157,7 +156,7 @@ async def logout(
             if access_jti:
                 # Store access JTI in blacklist until expiration
                 ttl = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
-                await redis.setex(f"bl:{access_jti}", ttl, "1")
+                await revocation_list.revoke(access_jti, ttl)
         except JWTError:
             pass # Token already bad or expired
             
@@ -169,7 +168,7 @@ async def logout(
                 if refresh_jti:
                     # Store refresh JTI in blacklist until expiration
                     ttl = settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
-                    await redis.setex(f"bl:{refresh_jti}", ttl, "1")
+                    await revocation_list.revoke(refresh_jti, ttl)
             except JWTError:
                 pass
 
@@ -1,21 +1,28 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
 from config.database import get_db, AsyncSessionLocal
 from models.match import Match
-from models.user import User
 from routes.dependencies import get_current_user
-from services.chat_service import ChatService, manager
+from services.chat_service import ChatService, manager, message_frame, read_frame
+from services.unread_counter import UnreadCounters
+from services.block_service import BlockService
+from services.rate_limiter import TokenBucket, rate_limiter
 from jose import jwt, JWTError
 from config.settings import settings
-from config.redis import get_redis_pool
-import time
+from datetime import datetime, timezone
 from typing import List
-from schemas.chat import MessageResponse
+from schemas.chat import (
+    MessageResponse, MessageSyncResponse, MarkReadRequest, MarkReadResponse, UnreadCountsResponse
+)
+import json
 
 router = APIRouter()
 
+# Messages per round trip when replaying a gap
+SYNC_BATCH_SIZE = 200
+
 async def get_user_from_token(token: str, db: AsyncSession):
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -26,103 +33,275 @@ async def get_user_from_token(token: str, db: AsyncSession):
     except JWTError:
         return None
 
+async def authorize_chat(db: AsyncSession, token: str, match_id: uuid.UUID):
+    """
+    Resolves the socket's user and checks they may chat in the match.
+    Returns (user_id, peer_id, is_shadowbanned), or None to reject the connection.
+    """
+    from sqlalchemy.future import select
+    from sqlalchemy import or_
+    from services.user_service import UserService
+
+    user_id = await get_user_from_token(token, db)
+    if not user_id:
+        return None
+
+    # Verify match belongs to user
+    qry = select(Match.user1_id, Match.user2_id).where(
+        Match.id == match_id,
+        or_(Match.user1_id == user_id, Match.user2_id == user_id)
+    )
+    match = (await db.execute(qry)).first()
+    if not match:
+        return None
+
+    # Check if current user is shadowbanned
+    user_entity = await UserService(db).get_auth_user(user_id)
+    is_shadowbanned = user_entity.is_shadowbanned if user_entity else False
+
+    # Get peer id
+    peer_id = match.user1_id if match.user2_id == user_id else match.user2_id
+
+    # Check if block exists
+    if await BlockService(db).is_blocked(user_id, peer_id):
+        return None
+    return user_id, peer_id, is_shadowbanned
+
+def parse_client_frame(data: str) -> dict | None:
+    """
+    Client frames are JSON envelopes:
+      {"type": "message", "content": "..."}
+      {"type": "read", "up_to_seq": N}   the client has shown everything up to seq N
+      {"type": "pong"}                   heartbeat answer
+    Text that isn't an envelope is a chat message from an older client that sent
+    bare text. Returns None for a malformed envelope.
+    """
+    try:
+        frame = json.loads(data)
+    except ValueError:
+        frame = None
+    if not isinstance(frame, dict) or frame.get("type") not in ("message", "read", "pong"):
+        return {"type": "message", "content": data}
+    if frame["type"] == "message" and not isinstance(frame.get("content"), str):
+        return None
+    if frame["type"] == "read":
+        up_to_seq = frame.get("up_to_seq")
+        if not isinstance(up_to_seq, int) or isinstance(up_to_seq, bool) or up_to_seq < 0:
+            return None
+    return frame
+
+async def check_rate_limit(bucket: TokenBucket, key: str, limit: tuple[int, int]) -> bool:
+    # This socket's own bucket turns away floods without a round trip; the shared
+    # limit then covers the user's other devices and nodes
+    if not bucket.hit().allowed:
+        return False
+    try:
+        return (await rate_limiter.hit(key, *limit)).allowed
+    except Exception as e:
+        print(f"Chat rate limit redis error: {e}")
+        return True
+
+async def handle_read_frame(up_to_seq: int, match_id: uuid.UUID, user_id: uuid.UUID, peer_id: uuid.UUID, is_shadowbanned: bool):
+    try:
+        async with AsyncSessionLocal() as db:
+            marked = await ChatService(db).mark_read(match_id, user_id, up_to_seq)
+    except Exception as e:
+        print(f"Chat mark read failed: {e}")
+        return
+    if marked and not is_shadowbanned:
+        await manager.send_personal_message(read_frame(match_id, user_id, up_to_seq), peer_id)
+
 @router.websocket("/ws/{match_id}")
-async def websocket_endpoint(websocket: WebSocket, match_id: uuid.UUID, token: str):
+async def websocket_endpoint(websocket: WebSocket, match_id: uuid.UUID, token: str, resume_from: int | None = None):
+    # Sessions are only held while authorizing and replaying history; an idle socket
+    # must not pin a pooled database connection. Message writes go through the
+    # shared write-behind writer.
     async with AsyncSessionLocal() as db:
-        user_id = await get_user_from_token(token, db)
-        if not user_id:
-            await websocket.close(code=1008)
-            return
-            
-        # Verify match belongs to user
-        from sqlalchemy.future import select
-        from sqlalchemy import or_
-        qry = select(Match).where(
-            Match.id == match_id,
-            or_(Match.user1_id == user_id, Match.user2_id == user_id)
-        )
-        match = (await db.execute(qry)).scalars().first()
-        if not match:
-            await websocket.close(code=1008)
-            return
-
-        # Check if current user is shadowbanned
-        user_record = await db.execute(select(User).where(User.id == user_id))
-        user_entity = user_record.scalars().first()
-        is_shadowbanned = user_entity.is_shadowbanned if user_entity else False
-
-        # Get peer id
-        peer_id = match.user1_id if match.user2_id == user_id else match.user2_id
-
-        # Check if block exists
-        from models.block import Block
-        from sqlalchemy import and_
-        block_check = await db.execute(
-            select(Block).where(
-                or_(
-                    and_(Block.blocker_id == user_id, Block.blocked_id == peer_id),
-                    and_(Block.blocker_id == peer_id, Block.blocked_id == user_id)
-                )
-            )
-        )
-        if block_check.scalars().first():
-            await websocket.close(code=1008)
-            return
+        authorized = await authorize_chat(db, token, match_id)
+    if not authorized:
+        await websocket.close(code=1008)
+        return
+    user_id, peer_id, is_shadowbanned = authorized
 
-        await manager.connect(user_id, websocket)
-        chat_service = ChatService(db)
+    await manager.connect(user_id, websocket)
+    chat_service = ChatService()
 
-        try:
-            redis = await get_redis_pool()
+    try:
+        if resume_from is not None:
+            # Replay what the client missed. Live delivery is already subscribed, so a
+            # message may arrive both ways; clients drop duplicates by seq.
             while True:
-                data = await websocket.receive_text()
-                
-                # Check message rate limit (30 msgs / 60 seconds)
-                try:
-                    current_time = int(time.time())
-                    window_start = current_time - 60
-                    key = f"rate_limit_msg:{user_id}"
-                    
-                    async with redis.pipeline(transaction=True) as pipe:
-                        pipe.zremrangebyscore(key, 0, window_start)
-                        pipe.zcard(key)
-                        pipe.zadd(key, {str(current_time): current_time})
-                        pipe.expire(key, 60)
-                        results = await pipe.execute()
-                    
-                    if results[1] >= 30:
-                        await websocket.send_json({"error": "Message rate limit exceeded. Slow down."})
-                        continue
-                except Exception as e:
-                    print(f"Chat rate limit redis error: {e}")
-                    pass
-                
-                # Save to db
-                msg = await chat_service.save_message(match_id, user_id, data)
-                
-                # Send to peer ONLY if not shadowbanned
-                if not is_shadowbanned:
-                    message_data = {
-                        "id": str(msg.id),
-                        "match_id": str(match_id),
-                        "sender_id": str(user_id),
-                        "content": data
-                    }
-                    await manager.send_personal_message(message_data, peer_id)
-        except WebSocketDisconnect:
-            manager.disconnect(user_id, websocket)
+                async with AsyncSessionLocal() as db:
+                    backlog = await ChatService(db).sync_messages(match_id, resume_from, SYNC_BATCH_SIZE)
+                for msg in backlog:
+                    await manager.send_to_socket(user_id, websocket, message_frame(msg))
+                if len(backlog) < SYNC_BATCH_SIZE:
+                    break
+                resume_from = backlog[-1].seq
+
+        message_limit = (settings.CHAT_RATE_LIMIT_MESSAGES, settings.CHAT_RATE_LIMIT_WINDOW)
+        socket_limit = TokenBucket(*message_limit)
+        read_limit = TokenBucket(*message_limit)
+        last_read_seq = -1
+        while True:
+            data = await websocket.receive_text()
+            manager.touch(user_id, websocket)
+            frame = parse_client_frame(data)
+            if frame is None:
+                await manager.send_to_socket(user_id, websocket, {"error": "Malformed frame."})
+                continue
+            if frame["type"] == "pong":
+                continue
+
+            if frame["type"] == "read":
+                # Receipts only move forward, so repeats and stale ones are dropped
+                # before they cost an UPDATE; the rest are rate limited like messages
+                if frame["up_to_seq"] <= last_read_seq:
+                    continue
+                if not await check_rate_limit(read_limit, f"rate_limit_read:{user_id}", message_limit):
+                    await manager.send_to_socket(user_id, websocket, {"error": "Read receipt rate limit exceeded. Slow down."})
+                    continue
+                last_read_seq = frame["up_to_seq"]
+                await handle_read_frame(last_read_seq, match_id, user_id, peer_id, is_shadowbanned)
+                continue
+            
+            # Check message rate limit (30 msgs / 60 seconds by default)
+            if not await check_rate_limit(socket_limit, f"rate_limit_msg:{user_id}", message_limit):
+                await manager.send_to_socket(user_id, websocket, {"error": "Message rate limit exceeded. Slow down."})
+                continue
+            
+            # Save to db
+            try:
+                msg = await chat_service.save_message(match_id, user_id, frame["content"])
+            except Exception as e:
+                print(f"Chat message save failed: {e}")
+                await manager.send_to_socket(user_id, websocket, {"error": "Message could not be sent. Try again."})
+                continue
+
+            await UnreadCounters.increment(peer_id, match_id)
+
+            # Tell the sender the message's id and seq so it can track its position
+            await manager.send_to_socket(
+                user_id, websocket,
+                {"type": "ack", "id": str(msg.id), "seq": msg.seq, "created_at": msg.created_at.isoformat()},
+            )
+
+            # Send to peer ONLY if not shadowbanned
+            if not is_shadowbanned:
+                await manager.send_personal_message(message_frame(msg), peer_id)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await manager.disconnect(user_id, websocket)
 
 
 @router.get("/{match_id}/messages", response_model=List[MessageResponse])
 async def get_chat_messages(
     match_id: uuid.UUID,
-    limit: int = 50,
-    offset: int = 0,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    before: str | None = None,
+    after: str | None = None,
+    since: datetime | None = None,
     current_user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
+    """
+    Chat history. Without cursors: the newest `limit` messages, newest first.
+    `before`: older messages than that cursor, newest first (scrolling back).
+    `after` / `since`: newer messages than that cursor / timestamp, oldest first
+    (catching up after a reconnect). X-Next-Cursor continues in the same direction.
+    """
+    from utils.pagination import encode_cursor, decode_cursor
+
+    if sum(arg is not None for arg in (before, after, since)) > 1:
+        raise HTTPException(status_code=400, detail="Use only one of before, after or since")
+
+    def parse(cursor: str) -> tuple[datetime, uuid.UUID]:
+        created_at, message_id = decode_cursor(cursor, 2)
+        try:
+            return datetime.fromisoformat(created_at), uuid.UUID(message_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
     chat_service = ChatService(db)
-    # verify user owns match (skipped full validation for brevity, but should be done)
-    # the schema will dictate the output naturally
-    messages = await chat_service.get_messages(match_id, limit, offset)
+    if not await chat_service.is_participant(match_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Match not found")
+    messages = await chat_service.get_messages(
+        match_id,
+        limit,
+        offset,
+        before=parse(before) if before else None,
+        after=parse(after) if after else ((since, None) if since else None),
+    )
+    if not offset and len(messages) == limit:
+        last = messages[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at.isoformat(), str(last.id))
     return messages
+
+@router.get("/unread", response_model=UnreadCountsResponse)
+async def get_unread_counts(
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Unread messages per match and in total, for the inbox badge.
+    """
+    counts = await UnreadCounters(db).load(current_user.id)
+    if counts is None:
+        raise HTTPException(status_code=503, detail="Unread counts temporarily unavailable")
+    counts = {match_id: count for match_id, count in counts.items() if count}
+    return {"total": sum(counts.values()), "matches": counts}
+
+@router.post("/{match_id}/read", response_model=MarkReadResponse)
+async def mark_chat_read(
+    match_id: uuid.UUID,
+    body: MarkReadRequest,
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Marks the peer's messages up to `up_to_seq` (or up to `message_id`) as read.
+    """
+    chat_service = ChatService(db)
+    if not await chat_service.is_participant(match_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Match not found")
+    up_to_seq = body.up_to_seq
+    if up_to_seq is None:
+        up_to_seq = await chat_service.seq_of(match_id, body.message_id)
+        if up_to_seq is None:
+            raise HTTPException(status_code=404, detail="Message not found")
+
+    marked = await chat_service.mark_read(match_id, current_user.id, up_to_seq)
+    if marked and not current_user.is_shadowbanned:
+        match = await db.get(Match, match_id)
+        peer_id = match.user1_id if match.user2_id == current_user.id else match.user2_id
+        await manager.send_personal_message(read_frame(match_id, current_user.id, up_to_seq), peer_id)
+    return {"up_to_seq": up_to_seq, "marked": marked}
+
+@router.get("/{match_id}/sync", response_model=MessageSyncResponse)
+async def sync_chat_messages(
+    match_id: uuid.UUID,
+    after_seq: int = Query(0, ge=0),
+    limit: int = Query(SYNC_BATCH_SIZE, ge=1, le=500),
+    current_user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Messages after `after_seq`, in order. Call again from `last_seq` while `has_more`.
+    """
+    chat_service = ChatService(db)
+    if not await chat_service.is_participant(match_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Match not found")
+    messages = await chat_service.sync_messages(match_id, after_seq, limit + 1)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return {
+        "messages": messages,
+        "last_seq": messages[-1].seq if messages else after_seq,
+        "has_more": has_more,
+    }
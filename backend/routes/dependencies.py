@@ -6,10 +6,10 @@ import uuid
 
 from config.settings import settings
 from config.database import get_db
-from config.redis import get_redis_pool
+from services.token_revocation import revocation_list
 from models.user import User, UserRole
 from services.user_service import UserService
-from services.streak_service import StreakService
+from services.streak_service import activity_gate
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
@@ -30,15 +30,9 @@ async def get_current_user(
         if user_id is None or jti is None:
             raise credentials_exception
             
-        # Check if token is blacklisted in Redis
-        try:
-            redis = await get_redis_pool()
-            is_blacklisted = await redis.get(f"bl:{jti}")
-            if is_blacklisted:
-                raise HTTPException(status_code=401, detail="Token has been revoked")
-        except Exception as e:
-            # If redis fails, log it but don't fail authentication entirely (fail-open for resilience, or fail-closed based on security posture)
-            print(f"Redis blacklist check failed: {e}")
+        # Check if token is revoked (answered from the local mirror; fail policy set in settings)
+        if await revocation_list.is_revoked(jti):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
 
         token_type: str = payload.get("type")
         if token_type != "access":
@@ -47,15 +41,14 @@ async def get_current_user(
         raise credentials_exception
     
     user_service = UserService(db)
-    user = await user_service.get_user_by_id(uuid.UUID(user_id))
+    user = await user_service.get_auth_user(uuid.UUID(user_id))
     if user is None:
         raise credentials_exception
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
         
-    # Asynchronously increment streak if active today
-    streak_service = StreakService(db)
-    background_tasks.add_task(streak_service.process_daily_activity, user.id)
+    # Mark the user active today; streaks are applied in bulk by the flush job
+    background_tasks.add_task(activity_gate.record, user.id)
     
     return user
 
@@ -1,13 +1,13 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config.database import get_db
 from models.user import User
 from routes.dependencies import get_current_user
-from schemas.interactions import LikeCreate, MatchResponse
+from schemas.interactions import LikeCreate, MatchResponse, SwipeBatch, SwipeResult
 from services.matching_service import MatchingService
-from typing import List
-from models.block import Block
+from typing import List, Literal
+from services.block_service import BlockService
 import uuid
 
 router = APIRouter()
@@ -22,13 +22,33 @@ async def like_user(
     result = await matching_service.create_like(current_user.id, like_in)
     return result
 
+@router.post("/swipes", response_model=List[SwipeResult])
+async def swipe_batch(
+    batch: SwipeBatch,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Lets the client queue several swipes and send them together
+    matching_service = MatchingService(db)
+    return await matching_service.apply_swipes(current_user.id, batch.swipes)
+
 @router.get("/", response_model=List[MatchResponse])
 async def get_my_matches(
+    response: Response,
+    sort: Literal["recent", "compatibility", "activity"] = "recent",
+    limit: int | None = Query(None, ge=1, le=100),
+    cursor: str | None = None,
+    inbox: bool = False,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     matching_service = MatchingService(db)
-    matches = await matching_service.get_matches(current_user.id)
+    matches, next_cursor = await matching_service.get_matches(
+        current_user.id, sort=sort, limit=limit, cursor=cursor, inbox=inbox
+    )
+    # Only set when paging with ?limit=; pass it back as ?cursor= for the next page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return matches
 
 @router.post("/{peer_id}/block")
@@ -37,15 +57,6 @@ async def block_user(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    from sqlalchemy.future import select
-    # Check if already blocked
-    existing = await db.execute(
-        select(Block).where(Block.blocker_id == current_user.id, Block.blocked_id == peer_id)
-    )
-    if existing.scalars().first():
+    if not await BlockService(db).create_block(current_user.id, peer_id):
         return {"detail": "User already blocked"}
-
-    block = Block(blocker_id=current_user.id, blocked_id=peer_id)
-    db.add(block)
-    await db.commit()
     return {"detail": "User blocked successfully"}
@@ -9,6 +9,7 @@ from models.user import User
 from models.report import Report, ReportStatus
 from routes.dependencies import get_current_user
 from schemas.report import ReportCreate, ReportResponse
+from services.user_cache import user_cache
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
@@ -60,6 +61,7 @@ async def create_report(
         target_user.is_active = False
         target_user.is_shadowbanned = True # apply shadowban or just deactivate
         await db.commit()
+        await user_cache.invalidate(target_user.id)
 
     await db.refresh(new_report)
     return new_report
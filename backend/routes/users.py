@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config.database import get_db
@@ -14,29 +15,42 @@ router = APIRouter()
 async def discover_users(
     min_age: int = 18,
     max_age: int = 100,
+    limit: int = Query(20, ge=1, le=50),
+    cursor: str | None = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     from fastapi import HTTPException
     user_service = UserService(db)
-    my_profile = await user_service.get_profile(current_user.id)
+    my_profile = await user_service.get_profile_row(current_user.id)
     if not my_profile:
         raise HTTPException(status_code=400, detail="Profile required to discover users")
         
-    profiles = await user_service.get_discover_feed(
+    profiles, next_cursor = await user_service.get_discover_feed(
         current_user_id=current_user.id,
-        user_gender=my_profile.gender,
-        interested_in=my_profile.interested_in,
+        user_gender=my_profile["gender"],
+        interested_in=my_profile["interested_in"],
         min_age=min_age,
         max_age=max_age,
-        user_latitude=getattr(my_profile, "latitude", None),
-        user_longitude=getattr(my_profile, "longitude", None),
+        limit=limit,
+        user_latitude=my_profile["latitude"],
+        user_longitude=my_profile["longitude"],
+        cursor=cursor,
     )
-    return profiles
+    # Keyset cursor for the next page; pass it back as ?cursor= to continue where this page ended
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    # Rows are already shaped like ProfileResponse, so encode them directly
+    # instead of validating each one through the response model
+    return ORJSONResponse(profiles, headers=headers)
 
 @router.get("/me", response_model=UserResponse)
-async def read_current_user(current_user: User = Depends(get_current_user)):
-    return current_user
+async def read_current_user(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # The auth dependency serves a cached identity snapshot; load the full row for streak info
+    user_service = UserService(db)
+    return await user_service.get_user_by_id(current_user.id)
 
 @router.put("/me/account", response_model=UserResponse)
 async def update_account_details(
@@ -62,10 +76,10 @@ async def get_my_profile(
 ):
     from fastapi import HTTPException
     user_service = UserService(db)
-    profile = await user_service.get_profile(current_user.id)
+    profile = await user_service.get_profile_row(current_user.id)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return profile
+    return ORJSONResponse(profile)
 
 @router.post("/me/profile", response_model=ProfileResponse)
 async def create_my_profile(
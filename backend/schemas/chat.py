@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 import uuid
 from datetime import datetime
 
@@ -12,7 +12,33 @@ class MessageResponse(BaseModel):
     sender_id: uuid.UUID
     content: str
     is_read: bool
+    seq: int
     created_at: datetime
 
     class Config:
         from_attributes = True
+
+class MarkReadRequest(BaseModel):
+    # Either position works: the seq of the last message read, or its id
+    up_to_seq: int | None = Field(None, ge=0)
+    message_id: uuid.UUID | None = None
+
+    @model_validator(mode='after')
+    def check_position(self):
+        if (self.up_to_seq is None) == (self.message_id is None):
+            raise ValueError('Provide exactly one of up_to_seq or message_id')
+        return self
+
+class MarkReadResponse(BaseModel):
+    up_to_seq: int
+    marked: int
+
+class UnreadCountsResponse(BaseModel):
+    total: int
+    matches: dict[uuid.UUID, int]
+
+class MessageSyncResponse(BaseModel):
+    messages: list[MessageResponse]
+    # Highest seq returned (or the requested after_seq if nothing is new); resume from it
+    last_seq: int
+    has_more: bool
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal
 import uuid
 from datetime import datetime
 
@@ -6,6 +7,21 @@ class LikeCreate(BaseModel):
     to_user_id: uuid.UUID
     is_superlike: bool = False
 
+class SwipeItem(BaseModel):
+    to_user_id: uuid.UUID
+    action: Literal["like", "superlike", "pass"]
+
+class SwipeBatch(BaseModel):
+    swipes: list[SwipeItem] = Field(..., min_length=1, max_length=100)
+
+class SwipeResult(BaseModel):
+    to_user_id: uuid.UUID
+    action: str
+    # success | passed | already_liked | already_passed | duplicate | invalid | not_found
+    status: str
+    match: bool = False
+    match_id: uuid.UUID | None = None
+
 class MatchResponse(BaseModel):
     id: uuid.UUID
     user1_id: uuid.UUID
@@ -13,6 +29,10 @@ class MatchResponse(BaseModel):
     is_active: bool
     created_at: datetime
     peer_profile: dict | None = None
+    # Only filled in for the inbox view (?inbox=true or sort=activity)
+    last_message: dict | None = None
+    last_activity_at: datetime | None = None
+    unread_count: int | None = None
 
     class Config:
         from_attributes = True
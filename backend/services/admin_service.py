@@ -6,7 +6,6 @@ from fastapi import HTTPException
 from sqlalchemy import func, or_
 
 from models.report import Report, ReportStatus
-from models.block import Block
 from models.user import User
 from models.admin_action import AdminAction
 from models.user_activity import UserActivity
@@ -14,6 +13,9 @@ from models.match import Match
 from models.message import Message
 from models.photo import Photo
 from schemas.admin import ReportCreate, AdminActionCreate, AdminStatsResponse
+from services.user_cache import user_cache
+from services.block_service import BlockService
+from services.recent_messages import RecentMessages
 
 class AdminService:
     def __init__(self, db: AsyncSession):
@@ -31,18 +33,9 @@ class AdminService:
         await self.db.refresh(report)
         return report
 
-    async def block_user(self, blocker_id: uuid.UUID, blocked_id: uuid.UUID) -> Block:
-        # Check if already blocked
-        qry = select(Block).where(Block.blocker_id == blocker_id, Block.blocked_id == blocked_id)
-        existing = (await self.db.execute(qry)).scalars().first()
-        if existing:
-            return existing
-
-        block = Block(blocker_id=blocker_id, blocked_id=blocked_id)
-        self.db.add(block)
-        await self.db.commit()
-        await self.db.refresh(block)
-        return block
+    async def block_user(self, blocker_id: uuid.UUID, blocked_id: uuid.UUID) -> bool:
+        # Returns False if the pair was already blocked
+        return await BlockService(self.db).create_block(blocker_id, blocked_id)
 
     async def get_pending_reports(self, page: int = 1, size: int = 50) -> dict:
         qry = select(Report).where(Report.status == ReportStatus.PENDING)
@@ -128,6 +121,7 @@ class AdminService:
         self.db.add(action)
         await self.db.delete(message)
         await self.db.commit()
+        await RecentMessages.invalidate(message.match_id)
         return {"status": "success"}
 
     async def take_admin_action(self, admin_id: uuid.UUID, action_in: AdminActionCreate):
@@ -152,5 +146,6 @@ class AdminService:
             self.db.add(target_user)
             
         await self.db.commit()
+        await user_cache.invalidate(action_in.target_user_id)
         await self.db.refresh(action)
         return action
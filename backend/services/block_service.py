@@ -0,0 +1,75 @@
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config.settings import settings
+from models.block import Block
+from services.discover_queue import DiscoverQueue
+from services.exclusion_filter import ExclusionFilter
+from services.local_cache import InvalidatedCache
+
+def block_pair(user_a: uuid.UUID, user_b: uuid.UUID) -> tuple[uuid.UUID, uuid.UUID]:
+    """
+    Canonical (smaller, larger) ordering of two users, as stored in blocks.user_low_id/user_high_id.
+    """
+    return (user_a, user_b) if user_a < user_b else (user_b, user_a)
+
+def _decode_pair(data: str) -> tuple[uuid.UUID, uuid.UUID]:
+    low, high = data.split(":")
+    return uuid.UUID(low), uuid.UUID(high)
+
+# "Is there a block between A and B" answers, keyed by canonical pair. New blocks
+# are broadcast so every worker drops its cached "not blocked" answer immediately.
+block_cache: InvalidatedCache[tuple[uuid.UUID, uuid.UUID], bool] = InvalidatedCache(
+    "block_cache",
+    max_size=settings.BLOCK_CACHE_MAX_SIZE,
+    ttl_seconds=settings.BLOCK_CACHE_TTL_SECONDS,
+    encode_key=lambda pair: f"{pair[0]}:{pair[1]}",
+    decode_key=_decode_pair,
+)
+
+# Inserts the block unless the pair is already blocked (in either direction)
+_CREATE_BLOCK_SQL = """
+INSERT INTO blocks (id, blocker_id, blocked_id, created_at, updated_at)
+VALUES (gen_random_uuid(), CAST(:blocker_id AS uuid), CAST(:blocked_id AS uuid), now(), now())
+ON CONFLICT (user_low_id, user_high_id) DO NOTHING
+RETURNING id
+"""
+
+class BlockService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def is_blocked(self, user_a: uuid.UUID, user_b: uuid.UUID) -> bool:
+        """
+        Whether either user has blocked the other. One unique-index probe on a cache miss.
+        """
+        pair = block_pair(user_a, user_b)
+        blocked = block_cache.get(pair)
+        if blocked is None:
+            # A block created while this query runs must not be overwritten by its answer
+            version = block_cache.version()
+            qry = select(Block.id).where(Block.user_low_id == pair[0], Block.user_high_id == pair[1])
+            blocked = (await self.db.execute(qry)).first() is not None
+            block_cache.set(pair, blocked, version)
+        return blocked
+
+    async def create_block(self, blocker_id: uuid.UUID, blocked_id: uuid.UUID) -> bool:
+        """
+        Blocks the pair and removes each user from the other's discover feed.
+        Returns False if a block between them already existed.
+        """
+        params = {"blocker_id": blocker_id, "blocked_id": blocked_id}
+        created = (await self.db.execute(text(_CREATE_BLOCK_SQL), params)).first() is not None
+        await self.db.commit()
+        if not created:
+            return False
+
+        await block_cache.invalidate(block_pair(blocker_id, blocked_id))
+        await ExclusionFilter.add(blocker_id, [blocked_id])
+        await ExclusionFilter.add(blocked_id, [blocker_id])
+        await DiscoverQueue.remove_candidates(blocker_id, [blocked_id])
+        await DiscoverQueue.remove_candidates(blocked_id, [blocker_id])
+        return True
@@ -1,53 +1,482 @@
+import asyncio
+import json
+import time
 import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
+from sqlalchemy import exists, func, or_, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from config.redis import get_redis_pool
+from config.settings import settings
 from models.message import Message
 from models.match import Match
+from services.message_writer import message_writer, SETTLE_SECONDS
+from services.recent_messages import RecentMessages
+from services.unread_counter import UnreadCounters
+
+def _in_range(msg: Message, before, after) -> bool:
+    key = (msg.created_at, msg.id)
+    if before is not None and not key < before:
+        return False
+    if after is not None:
+        if after[1] is None:
+            return msg.created_at > after[0]
+        return key > after
+    return True
+
+def _contiguous(messages: List[Message], after_seq: int) -> List[Message]:
+    """
+    The leading run of `messages` (in seq order) that continues from `after_seq`
+    without gaps. A later seq can be visible while an earlier one is still
+    buffered on another worker, so the run stops at the first missing seq unless
+    the message after the gap is old enough that the gap is permanent.
+    """
+    settled = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+    run = []
+    expected = after_seq + 1
+    for msg in messages:
+        if msg.seq > expected and msg.created_at > settled:
+            break
+        run.append(msg)
+        expected = msg.seq + 1
+    return run
 
 class ChatService:
     def __init__(self, db: AsyncSession = None):
         self.db = db
 
     async def save_message(self, match_id: uuid.UUID, sender_id: uuid.UUID, content: str) -> Message:
-        msg = Message(
-            match_id=match_id,
-            sender_id=sender_id,
-            content=content
+        # Persisted in batches by the write-behind writer; id and created_at are assigned up front
+        msg = await message_writer.write(match_id, sender_id, content)
+        await RecentMessages.push(msg)
+        return msg
+
+    async def get_messages(
+        self,
+        match_id: uuid.UUID,
+        limit: int = 50,
+        offset: int = 0,
+        before: tuple[datetime, uuid.UUID] | None = None,
+        after: tuple[datetime, uuid.UUID | None] | None = None,
+    ) -> list[Message]:
+        """
+        A page of the match's history. By default (and with `before`) newest first,
+        walking back in time; with `after` oldest first, walking forward, e.g. to
+        catch up after a reconnect. Keyset positions are (created_at, id); an `after`
+        without an id means everything strictly later than the timestamp. `after`
+        pages stop short of a message whose predecessor may still be unflushed on
+        another worker, so a client advancing its cursor never skips one.
+        `offset` paging is kept for older clients and ignores the keyset arguments.
+        The first page is served from the recent-messages cache when it is current.
+        """
+        first_page = not offset and before is None and after is None
+        if first_page:
+            cached = await RecentMessages.page(match_id, limit)
+            if cached is not None:
+                return cached
+
+        qry = select(Message).where(Message.match_id == match_id)
+        if offset:
+            qry = qry.order_by(Message.created_at.desc(), Message.id.desc()).offset(offset).limit(limit)
+            return (await self.db.execute(qry)).scalars().all()
+
+        if before is not None:
+            qry = qry.where(tuple_(Message.created_at, Message.id) < tuple_(*before))
+        if after is not None:
+            if after[1] is None:
+                qry = qry.where(Message.created_at > after[0])
+            else:
+                qry = qry.where(tuple_(Message.created_at, Message.id) > tuple_(*after))
+
+        descending = after is None
+        if descending:
+            qry = qry.order_by(Message.created_at.desc(), Message.id.desc())
+        else:
+            qry = qry.order_by(Message.created_at.asc(), Message.id.asc())
+        # A first page reads enough to re-seed the cache as well
+        fetch = max(limit, settings.CHAT_RECENT_CACHE_SIZE) if first_page else limit
+        messages = list((await self.db.execute(qry.limit(fetch))).scalars().all())
+        complete = len(messages) < fetch
+
+        # Messages accepted by this worker but not flushed yet belong in the page too
+        pending = [msg for msg in message_writer.pending_for(match_id) if _in_range(msg, before, after)]
+        if pending:
+            stored_ids = {msg.id for msg in messages}
+            messages.extend(msg for msg in pending if msg.id not in stored_ids)
+            messages.sort(key=lambda msg: (msg.created_at, msg.id), reverse=descending)
+        if after is not None:
+            messages = await self._without_gaps(match_id, after, messages)
+        if first_page:
+            await RecentMessages.seed(match_id, messages, complete)
+        return messages[:limit]
+
+    async def _without_gaps(
+        self,
+        match_id: uuid.UUID,
+        after: tuple[datetime, uuid.UUID | None],
+        messages: List[Message],
+    ) -> List[Message]:
+        # The seq the client already has: that of the last message at or before the cursor
+        qry = select(Message.seq).where(Message.match_id == match_id)
+        if after[1] is None:
+            qry = qry.where(Message.created_at <= after[0])
+        else:
+            qry = qry.where(tuple_(Message.created_at, Message.id) <= tuple_(*after))
+        qry = qry.order_by(Message.created_at.desc(), Message.id.desc()).limit(1)
+        seen = [(await self.db.execute(qry)).scalar() or 0]
+        seen += [msg.seq for msg in message_writer.pending_for(match_id) if not _in_range(msg, None, after)]
+
+        run = {msg.id for msg in _contiguous(sorted(messages, key=lambda msg: msg.seq), max(seen))}
+        return [msg for msg in messages if msg.id in run]
+
+    async def is_participant(self, match_id: uuid.UUID, user_id: uuid.UUID) -> bool:
+        qry = select(Match.id).where(
+            Match.id == match_id,
+            or_(Match.user1_id == user_id, Match.user2_id == user_id)
         )
-        self.db.add(msg)
+        return (await self.db.execute(qry)).first() is not None
+
+    async def sync_messages(self, match_id: uuid.UUID, after_seq: int, limit: int = 200) -> list[Message]:
+        """
+        Messages with seq greater than `after_seq`, in seq order: exactly the gap a
+        client that has seen everything up to `after_seq` is missing. Stops at a seq
+        that isn't stored yet (see _contiguous); the rest arrives live or on the next sync.
+        """
+        qry = (
+            select(Message)
+            .where(Message.match_id == match_id, Message.seq > after_seq)
+            .order_by(Message.seq)
+            .limit(limit)
+        )
+        messages = list((await self.db.execute(qry)).scalars().all())
+
+        # Include messages still buffered by this worker's writer
+        pending = [msg for msg in message_writer.pending_for(match_id) if msg.seq > after_seq]
+        if pending:
+            stored_ids = {msg.id for msg in messages}
+            messages.extend(msg for msg in pending if msg.id not in stored_ids)
+            messages.sort(key=lambda msg: msg.seq)
+            messages = messages[:limit]
+        return _contiguous(messages, after_seq)
+
+    async def seq_of(self, match_id: uuid.UUID, message_id: uuid.UUID) -> int | None:
+        for msg in message_writer.pending_for(match_id):
+            if msg.id == message_id:
+                return msg.seq
+        qry = select(Message.seq).where(Message.id == message_id, Message.match_id == match_id)
+        return (await self.db.execute(qry)).scalar()
+
+    async def mark_read(self, match_id: uuid.UUID, reader_id: uuid.UUID, up_to_seq: int) -> int:
+        """
+        Marks every message the peer sent in the match up to and including
+        `up_to_seq` as read, in one set-based UPDATE, and updates the reader's
+        unread counter. Returns how many messages changed. Messages still buffered
+        on other workers are marked read by their writer (see record_read).
+        """
+        await message_writer.record_read(match_id, reader_id, up_to_seq)
+        if any(msg.seq <= up_to_seq for msg in message_writer.pending_for(match_id)):
+            # Store this worker's buffered messages first so the UPDATE covers them
+            await message_writer.flush()
+
+        unread = (
+            Message.match_id == match_id,
+            Message.sender_id != reader_id,
+            Message.is_read == False,
+        )
+        marked = (
+            update(Message)
+            .where(*unread, Message.seq <= up_to_seq)
+            .values(is_read=True)
+            .returning(Message.id)
+            .cte("marked")
+        )
+        # Anything unread past the mark? Rows the UPDATE touches can't match, so the
+        # statement's snapshot answers it correctly
+        remaining = exists().where(*unread, Message.seq > up_to_seq)
+        qry = select(select(func.count()).select_from(marked).scalar_subquery(), remaining)
+        count, has_remaining = (await self.db.execute(qry)).one()
         await self.db.commit()
-        await self.db.refresh(msg)
-        return msg
 
-    async def get_messages(self, match_id: uuid.UUID, limit: int = 50, offset: int = 0):
-        qry = select(Message).where(Message.match_id == match_id).order_by(Message.created_at.desc()).offset(offset).limit(limit)
-        result = await self.db.execute(qry)
-        return result.scalars().all()
+        # Later messages buffered on other workers are invisible to `remaining`, so
+        # the counter is only cleared outright if no later seq was handed out at all
+        issued = await message_writer.issued_seq(match_id)
+        caught_up = not has_remaining and issued is not None and issued <= up_to_seq
+        await UnreadCounters.mark_read(reader_id, match_id, count, caught_up=caught_up)
+        await RecentMessages.mark_read(match_id, reader_id, up_to_seq)
+        return count
+
+def read_frame(match_id: uuid.UUID, reader_id: uuid.UUID, up_to_seq: int) -> dict:
+    """
+    WebSocket payload telling the sender their messages up to `up_to_seq` were read.
+    """
+    return {
+        "type": "read",
+        "match_id": str(match_id),
+        "reader_id": str(reader_id),
+        "up_to_seq": up_to_seq,
+    }
+
+def message_frame(msg: Message) -> dict:
+    """
+    WebSocket payload for a chat message.
+    """
+    return {
+        "type": "message",
+        "id": str(msg.id),
+        "match_id": str(msg.match_id),
+        "sender_id": str(msg.sender_id),
+        "content": msg.content,
+        "seq": msg.seq,
+        "created_at": msg.created_at.isoformat(),
+    }
+
+def _user_channel(user_id: uuid.UUID) -> str:
+    return f"chat:user:{user_id}"
+
+# Heartbeat frame; clients answer with {"type": "pong"}
+PING_FRAME = {"type": "ping"}
+
+class _Connection:
+    """
+    One socket with its bounded outbound queue. A dedicated writer task drains
+    the queue, so a slow socket only ever delays itself.
+    """
+
+    def __init__(self, user_id: uuid.UUID, websocket: WebSocket, queue_size: int):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.last_seen = time.monotonic()
+        self.writer: asyncio.Task | None = None
 
-# In-memory WebSocket manager (can be substituted with Redis Pub/Sub for distributed)
 class ConnectionManager:
+    """
+    WebSocket registry for this process, with delivery fanned out over Redis
+    pub/sub so a message reaches the peer whichever worker or node they are
+    connected to. The process subscribes to a channel per locally connected user;
+    sends publish to the recipient's channel and the listener task delivers them
+    to local sockets.
+
+    Every socket gets a bounded outbound queue and its own writer task. A socket
+    whose queue overflows, whose send stalls past CHAT_SEND_TIMEOUT, or that stops
+    answering heartbeats is evicted (closed) instead of holding up anyone else.
+    """
+
     def __init__(self):
-        # map user_id to list of active websockets
-        self.active_connections: Dict[uuid.UUID, List[WebSocket]] = {}
+        # map user_id to that user's live connections on this process
+        self.active_connections: Dict[uuid.UUID, List[_Connection]] = {}
+        self._pubsub = None
+        # Always subscribed, so the pub/sub connection exists before any user connects
+        self._node_channel = f"chat:node:{uuid.uuid4().hex}"
+        self.published = 0
+        self.delivered = 0
+        self.publish_failures = 0
+        self.dropped = 0
+        self.evicted = {"queue_full": 0, "send_timeout": 0, "send_error": 0, "heartbeat": 0}
+        # Keep references so in-flight closes of evicted sockets aren't garbage collected
+        self._closing: set[asyncio.Task] = set()
 
     async def connect(self, user_id: uuid.UUID, websocket: WebSocket):
         await websocket.accept()
+        conn = _Connection(user_id, websocket, settings.CHAT_OUTBOUND_QUEUE_SIZE)
+        conn.writer = asyncio.create_task(self._write_loop(conn))
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+            await self._subscribe(user_id)
+        self.active_connections[user_id].append(conn)
+
+    async def disconnect(self, user_id: uuid.UUID, websocket: WebSocket):
+        conn = self._find(user_id, websocket)
+        if conn is not None:
+            await self._remove(conn)
+
+    def touch(self, user_id: uuid.UUID, websocket: WebSocket):
+        # Any frame from the client (message or pong) counts as a heartbeat
+        conn = self._find(user_id, websocket)
+        if conn is not None:
+            conn.last_seen = time.monotonic()
 
-    def disconnect(self, user_id: uuid.UUID, websocket: WebSocket):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
+    async def send_to_socket(self, user_id: uuid.UUID, websocket: WebSocket, message: dict):
+        """
+        Queues a frame for one socket (acks, errors, history replay). Waits up to
+        CHAT_SEND_TIMEOUT for room in the queue rather than evicting outright, since
+        the caller is that socket's own handler. Raises WebSocketDisconnect if the
+        socket was evicted or its queue stays full, so the handler exits and cleans up.
+        """
+        conn = self._find(user_id, websocket)
+        if conn is None:
+            raise WebSocketDisconnect(code=1013)
+        try:
+            await asyncio.wait_for(conn.queue.put(message), timeout=settings.CHAT_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self._evict(conn, "queue_full")
+            raise WebSocketDisconnect(code=1013)
+        if self._find(user_id, websocket) is None:
+            # Evicted while waiting; nothing will drain the queue any more
+            raise WebSocketDisconnect(code=1013)
 
     async def send_personal_message(self, message: dict, user_id: uuid.UUID):
-        connections = self.active_connections.get(user_id, [])
-        for connection in connections:
-            await connection.send_json(message)
+        try:
+            redis = await get_redis_pool()
+            await redis.publish(_user_channel(user_id), json.dumps(message))
+            self.published += 1
+        except Exception as e:
+            # Redis unavailable: still reach the user's sockets on this process
+            self.publish_failures += 1
+            print(f"Chat publish failed: {e}")
+            await self._send_local(user_id, message)
+
+    async def _send_local(self, user_id: uuid.UUID, message: dict):
+        # Only enqueues, so delivery to each of the user's devices proceeds concurrently
+        for conn in list(self.active_connections.get(user_id, [])):
+            try:
+                conn.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                await self._evict(conn, "queue_full")
+
+    async def _write_loop(self, conn: _Connection):
+        while True:
+            message = await conn.queue.get()
+            try:
+                await asyncio.wait_for(conn.websocket.send_json(message), timeout=settings.CHAT_SEND_TIMEOUT)
+                self.delivered += 1
+            except asyncio.TimeoutError:
+                await self._evict(conn, "send_timeout")
+                return
+            except Exception as e:
+                print(f"Chat delivery to {conn.user_id} failed: {e}")
+                await self._evict(conn, "send_error")
+                return
+
+    async def heartbeat(self) -> None:
+        """
+        Pings every socket and evicts the ones that went quiet; meant to be run
+        as a lifespan task.
+        """
+        while True:
+            await asyncio.sleep(settings.CHAT_HEARTBEAT_INTERVAL)
+            deadline = time.monotonic() - settings.CHAT_HEARTBEAT_TIMEOUT
+            for conns in list(self.active_connections.values()):
+                for conn in list(conns):
+                    if conn.last_seen < deadline:
+                        await self._evict(conn, "heartbeat")
+                        continue
+                    try:
+                        conn.queue.put_nowait(PING_FRAME)
+                    except asyncio.QueueFull:
+                        self.dropped += 1
+                        await self._evict(conn, "queue_full")
+
+    def _find(self, user_id: uuid.UUID, websocket: WebSocket) -> _Connection | None:
+        for conn in self.active_connections.get(user_id, []):
+            if conn.websocket is websocket:
+                return conn
+        return None
+
+    async def _evict(self, conn: _Connection, reason: str):
+        if self._find(conn.user_id, conn.websocket) is None:
+            return
+        self.evicted[reason] += 1
+        await self._remove(conn)
+        # Closing a stalled peer waits on its close handshake, so it must not hold up
+        # the caller (often the pub/sub listener delivering to everyone else)
+        task = asyncio.create_task(self._close(conn))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(conn: _Connection):
+        try:
+            # 1013: try again later. The socket's handler sees the disconnect and exits.
+            await asyncio.wait_for(conn.websocket.close(code=1013), timeout=settings.CHAT_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _remove(self, conn: _Connection):
+        conns = self.active_connections.get(conn.user_id)
+        if conns is None or conn not in conns:
+            return
+        conns.remove(conn)
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        if not conns:
+            del self.active_connections[conn.user_id]
+            await self._unsubscribe(conn.user_id)
+
+    async def _subscribe(self, user_id: uuid.UUID):
+        # While the listener is (re)connecting it subscribes every connected user itself
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.subscribe(_user_channel(user_id))
+        except Exception as e:
+            print(f"Chat subscribe failed: {e}")
+
+    async def _unsubscribe(self, user_id: uuid.UUID):
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(_user_channel(user_id))
+        except Exception as e:
+            print(f"Chat unsubscribe failed: {e}")
+
+    async def _on_message(self, message: dict):
+        channel = message["channel"]
+        if not channel.startswith("chat:user:"):
+            return
+        try:
+            user_id = uuid.UUID(channel[len("chat:user:"):])
+            payload = json.loads(message["data"])
+        except ValueError:
+            return
+        await self._send_local(user_id, payload)
+
+    async def listen(self) -> None:
+        """
+        Long-running delivery loop; meant to be run as a lifespan task.
+        Reconnects with a short pause if Redis drops, resubscribing every local user.
+        """
+        while True:
+            try:
+                redis = await get_redis_pool()
+                pubsub = redis.pubsub()
+                subscribed = set(self.active_connections)
+                await pubsub.subscribe(self._node_channel, *[_user_channel(uid) for uid in subscribed])
+                self._pubsub = pubsub
+                try:
+                    # Users who connected while the subscription above was in flight
+                    for user_id in set(self.active_connections) - subscribed:
+                        await pubsub.subscribe(_user_channel(user_id))
+                    while True:
+                        # Short poll timeout so the pool's socket_timeout never trips on idle channels
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message:
+                            await self._on_message(message)
+                finally:
+                    self._pubsub = None
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Chat subscriber error: {e}")
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        depths = [conn.queue.qsize() for conns in self.active_connections.values() for conn in conns]
+        return {
+            "connected_users": len(self.active_connections),
+            "connections": len(depths),
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "published": self.published,
+            "delivered": self.delivered,
+            "publish_failures": self.publish_failures,
+            "dropped": self.dropped,
+            "evicted": dict(self.evicted),
+        }
 
 manager = ConnectionManager()
@@ -3,6 +3,7 @@ from typing import List, Dict, Any
 from uuid import UUID
 import json
 from datetime import datetime
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
@@ -140,3 +141,93 @@ class CompatibilityService:
         
         # Clamp between 0 and 100
         return max(0, min(100, total_score))
+
+    def score_candidates(
+        self,
+        user: Dict[str, Any],
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        interest_matrix: np.ndarray,
+        streaks: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Vectorized counterpart of the location, interest and streak components of
+        compute_compatibility_score, for ranking many candidates in one call.
+        `user` holds latitude/longitude/interests (a boolean row over the same
+        vocabulary as `interest_matrix`) and streak; candidate arrays are aligned
+        by row, with NaN for unknown coordinates.
+        """
+        # 1. Location (max 20), haversine as in calculate_distance_score
+        if user.get("latitude") is None or user.get("longitude") is None:
+            location_pts = np.full(len(latitudes), 10.0)
+        else:
+            lat1 = np.radians(user["latitude"])
+            lat2 = np.radians(latitudes)
+            dlat = lat2 - lat1
+            dlon = np.radians(longitudes - user["longitude"])
+            a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+            distance = 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            location_pts = np.floor(np.clip(20 - distance / 5, 0, None))
+            location_pts = np.where(np.isnan(location_pts), 10.0, location_pts)
+
+        # 2. Interests (max 30), Jaccard over the shared vocabulary
+        user_interests = user["interests"]
+        intersection = interest_matrix @ user_interests.astype(np.int32)
+        union = interest_matrix.sum(axis=1) + user_interests.sum() - intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            jaccard = np.where(union > 0, intersection / union, 0.0)
+        interest_pts = np.floor(np.minimum(30, jaccard * 40))
+        has_interests = interest_matrix.any(axis=1) & bool(user_interests.any())
+        interest_pts = np.where(has_interests, interest_pts, 5.0)
+
+        # 3. Activity/Streak Bonus (max 15)
+        streak_pts = np.floor(np.minimum(15, (streaks + user.get("streak", 0)) / 2))
+
+        return (location_pts + interest_pts + streak_pts).astype(np.int32)
+
+    async def predict_discover_scores(self, user_id: UUID, candidate_ids: List[UUID]) -> Dict[UUID, int]:
+        """
+        Predicted compatibility (location + interests + streak) of each candidate
+        with the user. Loads all features in one query and scores them in one
+        vectorized call; prompt overlap and chat engagement only apply to matches.
+        """
+        if not candidate_ids:
+            return {}
+
+        query = (
+            select(Profile.user_id, Profile.latitude, Profile.longitude, Profile.interests, UserStreak.current_streak)
+            .outerjoin(UserStreak, UserStreak.user_id == Profile.user_id)
+            .where(Profile.user_id.in_([user_id, *candidate_ids]))
+        )
+        rows = {row.user_id: row for row in (await self.db.execute(query)).all()}
+        me = rows.pop(user_id, None)
+        candidates = [rows[cid] for cid in candidate_ids if cid in rows]
+        if me is None or not candidates:
+            return {}
+
+        vocabulary: Dict[str, int] = {}
+        def interest_set(interests) -> set:
+            return {i.lower() for i in (interests or [])}
+        for row in [me, *candidates]:
+            for interest in interest_set(row.interests):
+                vocabulary.setdefault(interest, len(vocabulary))
+
+        interest_matrix = np.zeros((len(candidates), len(vocabulary)), dtype=bool)
+        for i, row in enumerate(candidates):
+            interest_matrix[i, [vocabulary[x] for x in interest_set(row.interests)]] = True
+        my_interests = np.zeros(len(vocabulary), dtype=bool)
+        my_interests[[vocabulary[x] for x in interest_set(me.interests)]] = True
+
+        scores = self.score_candidates(
+            {
+                "latitude": me.latitude,
+                "longitude": me.longitude,
+                "interests": my_interests,
+                "streak": me.current_streak or 0,
+            },
+            np.array([np.nan if r.latitude is None else r.latitude for r in candidates], dtype=float),
+            np.array([np.nan if r.longitude is None else r.longitude for r in candidates], dtype=float),
+            interest_matrix,
+            np.array([r.current_streak or 0 for r in candidates], dtype=float),
+        )
+        return {row.user_id: int(score) for row, score in zip(candidates, scores)}
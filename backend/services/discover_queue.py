@@ -0,0 +1,243 @@
+import asyncio
+import uuid
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.database import AsyncSessionLocal
+from config.redis import get_redis_pool
+from config.settings import settings
+
+# Keep references so in-flight refills aren't garbage collected
+_refill_tasks: set[asyncio.Task] = set()
+
+def _queue_key(user_id: uuid.UUID, params: dict) -> str:
+    # Age filters are chosen per request, so each range gets its own queue
+    return f"discover:queue:{user_id}:{params['min_age']}:{params['max_age']}"
+
+def _registry_key(user_id: uuid.UUID) -> str:
+    return f"discover:queues:{user_id}"
+
+def _served_key(queue_key: str) -> str:
+    # Highest score served from the queue so far: how far the user has read into it
+    return f"{queue_key}:served"
+
+class DiscoverQueue:
+    """
+    Precomputed, ranked discover candidates per user, stored as a Redis sorted set
+    (member = candidate user id, score = rank key, lower is better), ordered by
+    (score, member). The queue holds the DISCOVER_QUEUE_SIZE nearest candidates
+    re-ranked by predicted compatibility; paging past a truncated queue continues
+    from the database in distance order. Serving a page is one keyed read. Reads
+    record how far into the queue the user has got, and the queue is rebuilt in
+    the background once a read leaves fewer than the watermark unread; likes and
+    blocks remove candidates from it incrementally.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def read(
+        self,
+        user_id: uuid.UUID,
+        params: dict,
+        limit: int,
+        after: tuple[str, float, uuid.UUID] | None = None,
+    ) -> list[tuple[str, uuid.UUID, float]] | None:
+        """
+        Returns the next `limit` (source, candidate_id, score) entries after the
+        cursor position `after`. `source` is "queue" for compatibility-ranked entries
+        and "db" for distance-ordered ones: the continuation past a truncated queue,
+        or the whole first page while a missing queue is built in the background.
+        Every read extends the queue's TTL, so active users keep theirs.
+        Returns None if Redis is unavailable so the caller can serve from the database.
+        """
+        if after is not None and after[0] == "db":
+            # Already past the queue: keep walking the database keyset
+            return await self._continue_from_database(user_id, params, limit, (after[1], after[2]))
+
+        key = _queue_key(user_id, params)
+        ttl = settings.DISCOVER_QUEUE_TTL_SECONDS
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.expire(key, ttl)
+                pipe.expire(f"{key}:built", ttl)
+                pipe.expire(_registry_key(user_id), ttl)
+                pipe.expire(_served_key(key), ttl)
+                pipe.get(_served_key(key))
+                if after is None:
+                    pipe.zrange(key, 0, limit - 1, withscores=True)
+                else:
+                    # Entries tied with the cursor's score, then everything strictly after it
+                    pipe.zrangebyscore(key, after[1], after[1], withscores=True)
+                    pipe.zrangebyscore(key, f"({after[1]}", "+inf", start=0, num=limit, withscores=True)
+                pipe.get(f"{key}:built")
+                _, _, _, _, served, *pages, built = await pipe.execute()
+        except Exception as e:
+            print(f"Discover queue read failed: {e}")
+            return None
+
+        if built is None and after is None:
+            # First visit (or expired queue): serve this page in distance order and
+            # build the queue in the background for the next visit
+            self.schedule_refill(user_id, params)
+            return await self._continue_from_database(user_id, params, limit)
+        if built is None:
+            # The queue expired mid-scroll; only a rebuild can continue a queue cursor
+            ranked, built = await self.build(user_id, params)
+            if after is not None:
+                ranked = [
+                    (candidate_id, score) for candidate_id, score in ranked
+                    if (score, str(candidate_id)) > (after[1], str(after[2]))
+                ]
+            page = ranked[:limit]
+        else:
+            if after is None:
+                entries = pages[0]
+            else:
+                ties, rest = pages
+                entries = [(member, score) for member, score in ties if member > str(after[2])] + rest
+            page = [(uuid.UUID(member), score) for member, score in entries[:limit]]
+
+        if page and (served is None or page[-1][1] > float(served)):
+            await self._advance(user_id, params, page[-1][1])
+        page = [("queue", candidate_id, score) for candidate_id, score in page]
+        if len(page) < limit and built.startswith("truncated:"):
+            # The queue covers the nearest candidates up to a horizon; the rest follow by distance
+            _, horizon_score, horizon_user_id = built.split(":", 2)
+            page += await self._continue_from_database(
+                user_id, params, limit - len(page), (float(horizon_score), uuid.UUID(horizon_user_id))
+            )
+        return page
+
+    async def _advance(self, user_id: uuid.UUID, params: dict, position: float) -> None:
+        """
+        Records that the queue was read up to `position` and schedules a refill if
+        that leaves it nearly drained. Rereading already served entries changes
+        nothing, so a queue that is small by nature isn't rebuilt on every read.
+        """
+        key = _queue_key(user_id, params)
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.setex(_served_key(key), settings.DISCOVER_QUEUE_TTL_SECONDS, repr(position))
+                pipe.zcount(key, f"({position}", "+inf")
+                _, unread = await pipe.execute()
+        except Exception as e:
+            print(f"Discover queue position update failed: {e}")
+            return
+        if unread < settings.DISCOVER_QUEUE_WATERMARK:
+            self.schedule_refill(user_id, params)
+
+    async def _continue_from_database(
+        self,
+        user_id: uuid.UUID,
+        params: dict,
+        limit: int,
+        after: tuple[float, uuid.UUID] | None = None,
+    ) -> list[tuple[str, uuid.UUID, float]]:
+        from services.user_service import UserService
+
+        ranked = await UserService(self.db).get_discover_candidates(user_id, limit=limit, after=after, **params)
+        return [("db", candidate_id, score) for candidate_id, score in ranked]
+
+    async def build(self, user_id: uuid.UUID, params: dict) -> tuple[list[tuple[uuid.UUID, float]], str]:
+        """
+        Ranks the user's nearest candidates by predicted compatibility and stores them.
+        Returns the ranked (candidate_id, score) entries and the queue's built marker.
+        """
+        from services.compatibility_service import CompatibilityService
+        from services.user_service import UserService
+
+        nearest = await UserService(self.db).get_discover_candidates(
+            user_id, limit=settings.DISCOVER_QUEUE_SIZE, **params
+        )
+        predicted = await CompatibilityService(self.db).predict_discover_scores(
+            user_id, [candidate_id for candidate_id, _ in nearest]
+        )
+        # Best predicted compatibility first; the squared distance (< 1 degree² inside
+        # Pune) only breaks ties between equal scores
+        ranked = sorted(
+            (
+                (candidate_id, (100 - predicted.get(candidate_id, 0)) + min(distance, 0.999))
+                for candidate_id, distance in nearest
+            ),
+            key=lambda entry: (entry[1], str(entry[0])),
+        )
+        # Whether candidates beyond DISCOVER_QUEUE_SIZE were cut off, and the
+        # distance keyset position to continue from if so
+        if len(nearest) >= settings.DISCOVER_QUEUE_SIZE:
+            built = f"truncated:{nearest[-1][1]}:{nearest[-1][0]}"
+        else:
+            built = "complete"
+
+        key = _queue_key(user_id, params)
+        ttl = settings.DISCOVER_QUEUE_TTL_SECONDS
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                if ranked:
+                    pipe.zadd(key, {str(candidate_id): score for candidate_id, score in ranked})
+                    pipe.expire(key, ttl)
+                # Marks the queue as built even when there are no candidates
+                pipe.setex(f"{key}:built", ttl, built)
+                pipe.sadd(_registry_key(user_id), key)
+                pipe.expire(_registry_key(user_id), ttl)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Discover queue store failed: {e}")
+        return ranked, built
+
+    def schedule_refill(self, user_id: uuid.UUID, params: dict) -> None:
+        task = asyncio.create_task(_refill(user_id, dict(params)))
+        _refill_tasks.add(task)
+        task.add_done_callback(_refill_tasks.discard)
+
+    @staticmethod
+    async def remove_candidates(user_id: uuid.UUID, candidate_ids: list[uuid.UUID]) -> None:
+        """
+        Drops candidates from every queue the user has (after a like or block).
+        """
+        try:
+            redis = await get_redis_pool()
+            keys = await redis.smembers(_registry_key(user_id))
+            if not keys:
+                return
+            members = [str(candidate_id) for candidate_id in candidate_ids]
+            async with redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.zrem(key, *members)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Discover queue removal failed: {e}")
+
+    @staticmethod
+    async def invalidate(user_id: uuid.UUID) -> None:
+        """
+        Drops all of the user's queues, e.g. after their preferences or location change.
+        """
+        try:
+            redis = await get_redis_pool()
+            keys = await redis.smembers(_registry_key(user_id))
+            stale = [_registry_key(user_id)]
+            for key in keys:
+                stale.extend([key, f"{key}:built", _served_key(key)])
+            await redis.delete(*stale)
+        except Exception as e:
+            print(f"Discover queue invalidation failed: {e}")
+
+async def _refill(user_id: uuid.UUID, params: dict) -> None:
+    key = _queue_key(user_id, params)
+    try:
+        redis = await get_redis_pool()
+        # One refill per queue at a time across all workers; the TTL only matters
+        # if this worker dies mid-build
+        if not await redis.set(f"{key}:refilling", "1", nx=True, ex=30):
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await DiscoverQueue(db).build(user_id, params)
+        finally:
+            await redis.delete(f"{key}:refilling")
+    except Exception as e:
+        print(f"Discover queue refill failed: {e}")
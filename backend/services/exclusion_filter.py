@@ -0,0 +1,179 @@
+import uuid
+from sqlalchemy import union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config.redis import get_redis_pool
+from config.settings import settings
+from models.block import Block
+from models.like import Like
+from models.user_pass import UserPass
+
+def _set_key(user_id: uuid.UUID) -> str:
+    return f"discover:excluded:{user_id}"
+
+def _ready_key(user_id: uuid.UUID) -> str:
+    return f"discover:excluded:{user_id}:ready"
+
+def _building_key(user_id: uuid.UUID) -> str:
+    # Present while a rebuild is reading the database
+    return f"discover:excluded:{user_id}:building"
+
+def _adds_key(user_id: uuid.UUID) -> str:
+    # Exclusions added while a rebuild was reading, folded into the rebuilt set
+    return f"discover:excluded:{user_id}:adds"
+
+def _staging_key(user_id: uuid.UUID) -> str:
+    return f"discover:excluded:{user_id}:staging:{uuid.uuid4().hex}"
+
+# Longer than any rebuild takes; the building marker and the adds it collects expire after this
+REBUILD_WINDOW_SECONDS = 60
+
+# Adds to the set only while it is built (the ready key exists), keeping the set's
+# TTL in step with it, so users who never open discover don't collect keys that
+# never expire. During a rebuild the ids are also journaled for the rebuild to
+# pick up. KEYS: set, ready, building, adds. ARGV: window, ids...
+_ADD_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    redis.call('SADD', KEYS[4], unpack(ARGV, 2))
+    redis.call('EXPIRE', KEYS[4], ARGV[1])
+end
+local ttl = redis.call('TTL', KEYS[2])
+if ttl > 0 then
+    redis.call('SADD', KEYS[1], unpack(ARGV, 2))
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+return 0
+"""
+
+# Replaces the set with the staged rebuild plus anything added while it ran.
+# The adds journal isn't cleared, so a concurrent rebuild still sees it; every id
+# in it is a real exclusion. KEYS: set, ready, staging, adds. ARGV: ttl
+_STORE_LUA = """
+redis.call('SUNIONSTORE', KEYS[1], KEYS[3], KEYS[4])
+redis.call('DEL', KEYS[3])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+redis.call('SET', KEYS[2], '1', 'EX', ARGV[1])
+return 0
+"""
+
+# Process-wide counters for /admin/metrics
+exclusion_stats = {
+    "loads": 0,
+    "rebuilds": 0,
+    "unavailable": 0,
+    "consistency_checks": 0,
+    "consistency_mismatches": 0,
+}
+
+class ExclusionFilter:
+    """
+    Per-user set of user ids that must never show up in discover: everyone the
+    user liked, passed on, blocked, or was blocked by. Kept in Redis so discover can drop
+    them from candidate batches in-process instead of running NOT IN subqueries.
+    The database stays the source of truth; the set is rebuilt from it when
+    missing and periodically spot-checked against it.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _excluded_from_db(self, user_id: uuid.UUID) -> set[uuid.UUID]:
+        qry = union(
+            select(Like.to_user_id).where(Like.from_user_id == user_id),
+            select(UserPass.to_user_id).where(UserPass.from_user_id == user_id),
+            select(Block.blocked_id).where(Block.blocker_id == user_id),
+            select(Block.blocker_id).where(Block.blocked_id == user_id),
+        )
+        return set((await self.db.execute(qry)).scalars().all())
+
+    @staticmethod
+    async def _begin_rebuild(redis, user_id: uuid.UUID) -> None:
+        # Before reading the database: adds committed after the read starts are
+        # journaled from here on, so _store doesn't overwrite them
+        await redis.set(_building_key(user_id), "1", ex=REBUILD_WINDOW_SECONDS)
+
+    async def _store(self, redis, user_id: uuid.UUID, excluded: set[uuid.UUID]) -> None:
+        # Staged under a fresh key and swapped in by one script, so readers never
+        # see a half-written set
+        staging = _staging_key(user_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            if excluded:
+                pipe.sadd(staging, *[str(excluded_id) for excluded_id in excluded])
+                pipe.expire(staging, REBUILD_WINDOW_SECONDS)
+            pipe.eval(
+                _STORE_LUA, 4,
+                _set_key(user_id), _ready_key(user_id), staging, _adds_key(user_id),
+                settings.DISCOVER_EXCLUSION_TTL_SECONDS,
+            )
+            await pipe.execute()
+
+    async def load(self, user_id: uuid.UUID) -> set[uuid.UUID] | None:
+        """
+        Returns the user's exclusion set, rebuilding it from the database if needed.
+        Returns None if Redis is unavailable so the caller can fall back to SQL filtering.
+        """
+        exclusion_stats["loads"] += 1
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.exists(_ready_key(user_id))
+                pipe.smembers(_set_key(user_id))
+                ready, members = await pipe.execute()
+
+            if ready:
+                return {uuid.UUID(member) for member in members}
+
+            exclusion_stats["rebuilds"] += 1
+            await self._begin_rebuild(redis, user_id)
+            excluded = await self._excluded_from_db(user_id)
+            await self._store(redis, user_id, excluded)
+            return excluded
+        except Exception as e:
+            exclusion_stats["unavailable"] += 1
+            print(f"Discover exclusion set load failed: {e}")
+            return None
+
+    @staticmethod
+    async def add(user_id: uuid.UUID, excluded_ids: list[uuid.UUID]) -> None:
+        """
+        Records new exclusions (after a like, pass or block). If the set hasn't been
+        built yet nothing is written: the next load builds it from the database.
+        """
+        if not excluded_ids:
+            return
+        try:
+            redis = await get_redis_pool()
+            await redis.eval(
+                _ADD_LUA, 4,
+                _set_key(user_id), _ready_key(user_id), _building_key(user_id), _adds_key(user_id),
+                REBUILD_WINDOW_SECONDS, *[str(excluded_id) for excluded_id in excluded_ids],
+            )
+        except Exception as e:
+            print(f"Discover exclusion set update failed: {e}")
+
+    async def check_consistency(self, user_id: uuid.UUID) -> bool:
+        """
+        Compares the cached set with the database and repairs it on mismatch.
+        Returns True if the cached set was consistent (or not built yet).
+        """
+        redis = await get_redis_pool()
+        if not await redis.exists(_ready_key(user_id)):
+            return True
+
+        exclusion_stats["consistency_checks"] += 1
+        await self._begin_rebuild(redis, user_id)
+        cached = {uuid.UUID(member) for member in await redis.smembers(_set_key(user_id))}
+        expected = await self._excluded_from_db(user_id)
+        if cached == expected:
+            return True
+
+        exclusion_stats["consistency_mismatches"] += 1
+        print(
+            f"Discover exclusion set mismatch for {user_id}: "
+            f"{len(expected - cached)} missing, {len(cached - expected)} stale"
+        )
+        await self._store(redis, user_id, expected)
+        return False
@@ -0,0 +1,122 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+from config.redis import get_redis_pool, run_subscriber
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+class InvalidatedCache(Generic[K, V]):
+    """
+    Bounded TTL/LRU cache local to this worker. Writes that change a cached
+    entry call `invalidate()`, which evicts locally and broadcasts the key over
+    Redis so every other worker evicts it too. Keys travel over the channel as
+    strings via `encode_key`/`decode_key`.
+
+    A fill races invalidations: a value read from the database just before an
+    invalidation could be cached just after it. Callers take `version()` before
+    reading and pass it to `set()`, which drops the value if the key was
+    invalidated in between.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        ttl_seconds: float,
+        encode_key: Callable[[K], str] = str,
+        decode_key: Callable[[str], K] = str,
+    ):
+        self.name = name
+        self.channel = f"{name}:invalidate"
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.encode_key = encode_key
+        self.decode_key = decode_key
+        self._entries: "OrderedDict[K, tuple[float, V]]" = OrderedDict()
+        # Bumped on every eviction; each key remembers the version it was last evicted at
+        self._version = 0
+        self._evicted_at: "OrderedDict[K, int]" = OrderedDict()
+        # Versions at or below this may have had their eviction forgotten (bounded memory)
+        self._forgotten_before = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+
+    def get(self, key: K) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def version(self) -> int:
+        return self._version
+
+    def set(self, key: K, value: V, version: Optional[int] = None) -> None:
+        """
+        Caches `value`. With `version` (from `version()` before the value was read),
+        the value is dropped if the key has been invalidated since.
+        """
+        if version is not None and (
+            version < self._forgotten_before or self._evicted_at.get(key, 0) > version
+        ):
+            self.stale_fills += 1
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, key: K) -> None:
+        # Recorded even when nothing is cached: a fill may be in flight
+        self._version += 1
+        self._evicted_at[key] = self._version
+        self._evicted_at.move_to_end(key)
+        while len(self._evicted_at) > self.max_size:
+            _, forgotten = self._evicted_at.popitem(last=False)
+            self._forgotten_before = forgotten
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    async def invalidate(self, key: K) -> None:
+        self.evict(key)
+        try:
+            redis = await get_redis_pool()
+            await redis.publish(self.channel, self.encode_key(key))
+        except Exception as e:
+            # Other workers still converge once their TTL expires
+            print(f"{self.name} invalidation publish failed: {e}")
+
+    async def _on_invalidation(self, data: str) -> None:
+        try:
+            self.evict(self.decode_key(data))
+        except ValueError:
+            pass
+
+    async def listen(self) -> None:
+        await run_subscriber(self.channel, self._on_invalidation)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "stale_fills": self.stale_fills,
+        }
@@ -1,11 +1,78 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException
 import uuid
 
-from models.like import Like
 from models.match import Match
-from schemas.interactions import LikeCreate
+from schemas.interactions import LikeCreate, SwipeItem
+from services.discover_queue import DiscoverQueue
+from services.exclusion_filter import ExclusionFilter
+from services.unread_counter import UnreadCounters
+
+# Transaction-scoped locks on each unordered (from_user_id, to_user_id) pair,
+# taken in key order so overlapping batches can't deadlock
+_LOCK_PAIRS_SQL = """
+SELECT pg_advisory_xact_lock(pair_key)
+FROM (
+    SELECT DISTINCT hashtextextended(
+        LEAST(CAST(:from_user_id AS uuid), to_user_id)::text
+        || GREATEST(CAST(:from_user_id AS uuid), to_user_id)::text,
+        0
+    ) AS pair_key
+    FROM unnest(CAST(:like_ids AS uuid[])) AS t(to_user_id)
+    ORDER BY pair_key
+) AS pairs
+"""
+
+# Inserts all likes and passes (no-ops for ones that already exist) and, for every
+# new like the other user already reciprocated, creates the match for the canonical
+# (smaller, larger) pair. Returns one row per like/pass actually recorded.
+# The unique constraints make duplicate likes and matches impossible even without the locks.
+_APPLY_SWIPES_SQL = """
+WITH liked AS (
+    SELECT t.to_user_id, t.is_superlike
+    FROM unnest(CAST(:like_ids AS uuid[]), CAST(:superlikes AS boolean[])) AS t(to_user_id, is_superlike)
+    JOIN users u ON u.id = t.to_user_id
+),
+new_likes AS (
+    INSERT INTO likes (id, from_user_id, to_user_id, is_superlike, created_at, updated_at)
+    SELECT gen_random_uuid(), CAST(:from_user_id AS uuid), to_user_id, is_superlike, now(), now()
+    FROM liked
+    ON CONFLICT (from_user_id, to_user_id) DO NOTHING
+    RETURNING to_user_id
+),
+new_matches AS (
+    INSERT INTO matches (id, user1_id, user2_id, is_active, created_at, updated_at)
+    SELECT gen_random_uuid(),
+           LEAST(CAST(:from_user_id AS uuid), n.to_user_id),
+           GREATEST(CAST(:from_user_id AS uuid), n.to_user_id),
+           true, now(), now()
+    FROM new_likes n
+    WHERE EXISTS (
+        SELECT 1 FROM likes l
+        WHERE l.from_user_id = n.to_user_id AND l.to_user_id = CAST(:from_user_id AS uuid)
+    )
+    ON CONFLICT (user1_id, user2_id) DO NOTHING
+    RETURNING id, user1_id, user2_id
+),
+new_passes AS (
+    INSERT INTO passes (id, from_user_id, to_user_id, created_at, updated_at)
+    SELECT gen_random_uuid(), CAST(:from_user_id AS uuid), t.to_user_id, now(), now()
+    FROM unnest(CAST(:pass_ids AS uuid[])) AS t(to_user_id)
+    JOIN users u ON u.id = t.to_user_id
+    ON CONFLICT (from_user_id, to_user_id) DO NOTHING
+    RETURNING to_user_id
+)
+SELECT n.to_user_id, 'like' AS kind, m.id AS match_id
+FROM new_likes n
+LEFT JOIN new_matches m
+       ON m.user1_id = LEAST(CAST(:from_user_id AS uuid), n.to_user_id)
+      AND m.user2_id = GREATEST(CAST(:from_user_id AS uuid), n.to_user_id)
+UNION ALL
+SELECT to_user_id, 'pass' AS kind, CAST(NULL AS uuid) AS match_id
+FROM new_passes
+"""
 
 class MatchingService:
     def __init__(self, db: AsyncSession):
@@ -16,55 +83,109 @@ class MatchingService:
         if from_user_id == like_in.to_user_id:
             raise HTTPException(status_code=400, detail="Cannot like yourself")
 
-        # Check if like already exists
-        existing_like_qry = select(Like).where(
-            Like.from_user_id == from_user_id, Like.to_user_id == like_in.to_user_id
-        )
-        existing_like = (await self.db.execute(existing_like_qry)).scalars().first()
-        if existing_like:
+        action = "superlike" if like_in.is_superlike else "like"
+        result = (await self.apply_swipes(from_user_id, [SwipeItem(to_user_id=like_in.to_user_id, action=action)]))[0]
+        if result["status"] == "not_found":
+            raise HTTPException(status_code=404, detail="User not found")
+        if result["status"] == "already_liked":
             return {"status": "already_liked", "match": False}
+        return {"status": "success", "match": result["match"], "match_id": result["match_id"]}
 
-        # Create like
-        new_like = Like(
-            from_user_id=from_user_id,
-            to_user_id=like_in.to_user_id,
-            is_superlike=like_in.is_superlike
-        )
-        self.db.add(new_like)
+    async def apply_swipes(self, from_user_id: uuid.UUID, swipes: list[SwipeItem]) -> list[dict]:
+        """
+        Records an ordered batch of likes, superlikes and passes in one transaction
+        and returns a result per item, in the same order. Only the first swipe on a
+        given user counts; later ones in the same batch are reported as duplicates.
+        """
+        first_swipe: dict[uuid.UUID, SwipeItem] = {}
+        for swipe in swipes:
+            if swipe.to_user_id != from_user_id:
+                first_swipe.setdefault(swipe.to_user_id, swipe)
 
-        # Check for mutual like
-        mutual_like_qry = select(Like).where(
-            Like.from_user_id == like_in.to_user_id, Like.to_user_id == from_user_id
-        )
-        mutual_like = (await self.db.execute(mutual_like_qry)).scalars().first()
+        likes = [swipe for swipe in first_swipe.values() if swipe.action != "pass"]
+        params = {
+            "from_user_id": from_user_id,
+            "like_ids": [swipe.to_user_id for swipe in likes],
+            "superlikes": [swipe.action == "superlike" for swipe in likes],
+            "pass_ids": [swipe.to_user_id for swipe in first_swipe.values() if swipe.action == "pass"],
+        }
+
+        recorded = {}
+        if first_swipe:
+            # Serializes concurrent likes between the same two users, so that when both
+            # like each other at once the second statement sees the first like
+            if likes:
+                await self.db.execute(text(_LOCK_PAIRS_SQL), params)
+            rows = (await self.db.execute(text(_APPLY_SWIPES_SQL), params)).all()
+            await self.db.commit()
+            recorded = {row.to_user_id: row for row in rows}
 
-        match_created = False
-        match = None
-        if mutual_like:
-            # Create a match
-            match = Match(user1_id=from_user_id, user2_id=like_in.to_user_id)
-            self.db.add(match)
-            match_created = True
+        if recorded:
+            swiped_ids = list(recorded)
+            await ExclusionFilter.add(from_user_id, swiped_ids)
+            await DiscoverQueue.remove_candidates(from_user_id, swiped_ids)
 
-        await self.db.commit()
-        return {"status": "success", "match": match_created, "match_id": match.id if match else None}
+        results = []
+        for swipe in swipes:
+            result = {"to_user_id": swipe.to_user_id, "action": swipe.action, "match": False, "match_id": None}
+            row = recorded.get(swipe.to_user_id)
+            if swipe.to_user_id == from_user_id:
+                result["status"] = "invalid"
+            elif first_swipe[swipe.to_user_id] is not swipe:
+                result["status"] = "duplicate"
+            elif row is not None:
+                result["status"] = "passed" if swipe.action == "pass" else "success"
+                result["match"] = row.match_id is not None
+                result["match_id"] = row.match_id
+            else:
+                # Either swiped before, or the user doesn't exist
+                result["status"] = "already_passed" if swipe.action == "pass" else "already_liked"
+            results.append(result)
 
-    async def get_matches(self, user_id: uuid.UUID):
+        missing = [r for r in results if r["status"] in ("already_liked", "already_passed")]
+        if missing:
+            existing = await self._existing_user_ids([r["to_user_id"] for r in missing])
+            for r in missing:
+                if r["to_user_id"] not in existing:
+                    r["status"] = "not_found"
+        return results
+
+    async def _existing_user_ids(self, user_ids: list[uuid.UUID]) -> set[uuid.UUID]:
+        from models.user import User
+
+        result = await self.db.execute(select(User.id).where(User.id.in_(user_ids)))
+        return set(result.scalars().all())
+
+    async def get_matches(
+        self,
+        user_id: uuid.UUID,
+        sort: str = "recent",
+        limit: int | None = None,
+        cursor: str | None = None,
+        inbox: bool = False,
+    ) -> tuple[list[Match], str | None]:
+        """
+        The user's active, unblocked matches with each peer's profile summary attached,
+        ordered by recency, compatibility_score (best first) or last activity. With
+        `inbox` each match also carries its last message, last activity time and the
+        user's unread count. With a `limit` the list is paged by keyset and the opaque
+        cursor for the next page is returned.
+        Runs a fixed number of queries regardless of how many matches there are.
+        """
         # A match involves user_id as either user1_id or user2_id
-        from sqlalchemy import or_, and_, not_, exists
-        from sqlalchemy.orm import selectinload
+        from sqlalchemy import JSON, or_, and_, not_, exists, func, literal_column, true
+        from sqlalchemy.dialects.postgresql import aggregate_order_by
+        from models.message import Message
         from models.profile import Profile
-        from models.user import User
+        from models.photo import Photo
         from models.block import Block
+        from utils.pagination import encode_cursor, decode_cursor
 
-        # Subquery to check for blocks between the two users
+        # Subquery to check for a block between the two users: matches and blocks both
+        # store the pair as (smaller, larger) id, so this is one unique-index probe
         block_exists = exists().where(
-            or_(
-                and_(Block.blocker_id == user_id, Block.blocked_id == Match.user1_id),
-                and_(Block.blocker_id == user_id, Block.blocked_id == Match.user2_id),
-                and_(Block.blocked_id == user_id, Block.blocker_id == Match.user1_id),
-                and_(Block.blocked_id == user_id, Block.blocker_id == Match.user2_id)
-            )
+            Block.user_low_id == Match.user1_id,
+            Block.user_high_id == Match.user2_id,
         )
 
         qry = select(Match).where(
@@ -72,22 +193,140 @@ class MatchingService:
             Match.is_active == True,
             not_(block_exists)
         )
+
+        last_activity = None
+        # Unread counts come from the Redis counters; counted in SQL only without Redis
+        unread_counts = await UnreadCounters(self.db).load(user_id) if inbox or sort == "activity" else None
+        if inbox or sort == "activity":
+            # Latest message per match, read in the same query through a lateral join
+            last_message = (
+                select(Message.content, Message.sender_id, Message.created_at)
+                .where(Message.match_id == Match.id)
+                .order_by(Message.created_at.desc(), Message.id.desc())
+                .limit(1)
+                .lateral("last_message")
+            )
+            last_activity = func.coalesce(last_message.c.created_at, Match.created_at)
+            qry = qry.outerjoin(last_message, true()).add_columns(
+                last_message.c.content,
+                last_message.c.sender_id,
+                last_message.c.created_at.label("last_message_at"),
+                last_activity.label("last_activity_at"),
+            )
+            if unread_counts is None:
+                unread_count = (
+                    select(func.count())
+                    .where(Message.match_id == Match.id, Message.sender_id != user_id, Message.is_read == False)
+                    .scalar_subquery()
+                )
+                qry = qry.add_columns(unread_count.label("unread_count"))
+
+        if sort == "activity":
+            if cursor:
+                activity_at, after_id = self._decode_match_cursor(decode_cursor(cursor, 2), timestamp=True)
+                qry = qry.where(or_(
+                    last_activity < activity_at,
+                    and_(last_activity == activity_at, Match.id < after_id),
+                ))
+            qry = qry.order_by(last_activity.desc(), Match.id.desc())
+        elif sort == "compatibility":
+            # Unscored matches (not yet reached by the cron) go last
+            if cursor:
+                score, after_id = self._decode_match_cursor(decode_cursor(cursor, 2))
+                if score is None:
+                    qry = qry.where(Match.compatibility_score.is_(None), Match.id < after_id)
+                else:
+                    qry = qry.where(or_(
+                        Match.compatibility_score < score,
+                        and_(Match.compatibility_score == score, Match.id < after_id),
+                        Match.compatibility_score.is_(None),
+                    ))
+            qry = qry.order_by(Match.compatibility_score.desc().nulls_last(), Match.id.desc())
+        else:
+            if cursor:
+                created_at, after_id = self._decode_match_cursor(decode_cursor(cursor, 2), timestamp=True)
+                qry = qry.where(or_(
+                    Match.created_at < created_at,
+                    and_(Match.created_at == created_at, Match.id < after_id),
+                ))
+            qry = qry.order_by(Match.created_at.desc(), Match.id.desc())
+
+        if limit is not None:
+            qry = qry.limit(limit)
         result = await self.db.execute(qry)
-        matches = result.scalars().all()
+        if last_activity is None:
+            matches = result.scalars().all()
+        else:
+            matches = []
+            for row in result.all():
+                match = row.Match
+                match.last_message = None
+                if row.last_message_at is not None:
+                    match.last_message = {
+                        "content": row.content,
+                        "sender_id": row.sender_id,
+                        "created_at": row.last_message_at,
+                    }
+                match.last_activity_at = row.last_activity_at
+                match.unread_count = row.unread_count if unread_counts is None else unread_counts.get(match.id, 0)
+                matches.append(match)
+
+        # One query for every peer's summary, with their photos aggregated alongside
+        peer_ids = [match.user1_id if match.user2_id == user_id else match.user2_id for match in matches]
+        photo = func.json_build_object(
+            literal_column("'url'"), Photo.url,
+            literal_column("'is_primary'"), Photo.is_primary,
+        )
+        photos = (
+            select(func.coalesce(
+                func.json_agg(aggregate_order_by(photo, Photo.order)),
+                literal_column("'[]'::json"),
+                type_=JSON,
+            ))
+            .where(Photo.user_id == Profile.user_id)
+            .scalar_subquery()
+        )
+        peers = {}
+        if peer_ids:
+            peer_qry = select(Profile.user_id, Profile.first_name, Profile.bio, photos.label("photos")).where(
+                Profile.user_id.in_(peer_ids)
+            )
+            peers = {row.user_id: row for row in (await self.db.execute(peer_qry)).all()}
 
-        for match in matches:
-            peer_id = match.user1_id if match.user2_id == user_id else match.user2_id
-            profile_qry = select(Profile).join(User, Profile.user_id == User.id).options(selectinload(Profile.user).selectinload(User.photos)).where(Profile.user_id == peer_id)
-            peer_profile = (await self.db.execute(profile_qry)).scalars().first()
+        for match, peer_id in zip(matches, peer_ids):
+            peer_profile = peers.get(peer_id)
             if peer_profile:
-                # Convert to dict for the Pydantic peer_profile: dict | None field
-                photos = getattr(peer_profile.user, 'photos', [])
+                # Plain dict for the Pydantic peer_profile: dict | None field
                 match.peer_profile = {
                     "first_name": peer_profile.first_name,
                     "bio": peer_profile.bio,
-                    "photos": [{"url": p.url, "is_primary": p.is_primary} for p in photos]
+                    "photos": peer_profile.photos,
                 }
             else:
                 match.peer_profile = None
 
-        return matches
+        next_cursor = None
+        if limit is not None and len(matches) == limit:
+            last = matches[-1]
+            if sort == "compatibility":
+                sort_key = last.compatibility_score
+            elif sort == "activity":
+                sort_key = last.last_activity_at.isoformat()
+            else:
+                sort_key = last.created_at.isoformat()
+            next_cursor = encode_cursor(sort_key, str(last.id))
+        return matches, next_cursor
+
+    @staticmethod
+    def _decode_match_cursor(values: list, timestamp: bool = False):
+        from datetime import datetime
+
+        sort_key, after_id = values
+        try:
+            if timestamp:
+                sort_key = datetime.fromisoformat(sort_key)
+            elif sort_key is not None:
+                sort_key = int(sort_key)
+            return sort_key, uuid.UUID(after_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from config.database import AsyncSessionLocal
+from config.redis import get_redis_pool
+from config.settings import settings
+from models.message import Message
+from services.unread_counter import UnreadCounters
+
+logger = logging.getLogger(__name__)
+
+# Messages younger than this may still sit unflushed in some worker's buffer, so a
+# missing seq is only treated as gone for good (deleted, dropped) once the
+# message after it is older than this
+SETTLE_SECONDS = 5
+
+# Counters idle this long are dropped and resumed from the issued mark on next use
+SEQ_KEY_TTL_SECONDS = 7 * 86400
+# The highest seq issued per match is kept far longer than the counter. A counter
+# that expires resumes from it, never from the database alone, which can't see
+# rows still buffered on other workers.
+SEQ_ISSUED_TTL_SECONDS = 30 * 86400
+
+# Renumbering attempts for a row whose seq turns out to be taken, before dropping it
+SEQ_CONFLICT_RETRIES = 3
+
+# Next seq for the match: one past the counter, or past the issued mark if the
+# counter expired. Returns nil when both are gone (e.g. Redis lost its data), so
+# the caller seeds from the database. ARGV[3], when given, is a floor to continue
+# from: the highest seq known to be stored.
+_NEXT_SEQ_LUA = """
+local current = redis.call('GET', KEYS[1]) or redis.call('GET', KEYS[2])
+if not current and not ARGV[3] then
+    return nil
+end
+local seq = math.max(tonumber(current or 0), tonumber(ARGV[3] or 0)) + 1
+redis.call('SET', KEYS[1], seq, 'EX', ARGV[1])
+redis.call('SET', KEYS[2], seq, 'EX', ARGV[2])
+return seq
+"""
+
+# Read marks are kept this long, past any flush retry that could still insert rows they cover
+READ_MARK_TTL_SECONDS = 86400
+
+# Moves a reader's mark forward only. KEYS: marks. ARGV: reader id, seq, ttl
+_RECORD_READ_LUA = """
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or 0)
+if tonumber(ARGV[2]) > current then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 0
+"""
+
+def _seq_key(match_id: uuid.UUID) -> str:
+    return f"chat:seq:{match_id}"
+
+def _issued_key(match_id: uuid.UUID) -> str:
+    return f"chat:seq:{match_id}:issued"
+
+def _read_marks_key(match_id: uuid.UUID) -> str:
+    # reader id -> highest seq they marked read
+    return f"chat:read:{match_id}"
+
+class MessageWriter:
+    """
+    Write-behind buffer for chat messages. Messages get their id and timestamp
+    here, are handed back to the caller straight away, and are persisted by a
+    background task in multi-row INSERTs, one transaction per batch.
+
+    CHAT_WRITE_DURABILITY picks what the caller waits for:
+      "buffered" returns as soon as the message is queued (a crash can lose up
+                 to one flush interval of messages)
+      "flush"    waits until the batch holding the message has committed
+                 (group commit: still one transaction per batch, not per message),
+                 for at most CHAT_WRITE_FLUSH_TIMEOUT
+
+    A message that can't be stored even after renumbering is dropped: a "flush"
+    caller gets the error, a "buffered" sender is told over their chat channel.
+
+    Mark-read only updates stored rows, so readers' marks are recorded here too
+    and applied to rows inserted after them (see record_read).
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int, durability: str, flush_timeout: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.durability = durability
+        self.flush_timeout = flush_timeout
+        self._pending: List[tuple[dict, Optional[asyncio.Future]]] = []
+        # Batch currently being inserted, still visible to pending_for
+        self._in_flight: List[tuple[dict, Optional[asyncio.Future]]] = []
+        # Ids from the batch in flight that are already committed, in case the rest fails
+        self._committed: set[uuid.UUID] = set()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.written = 0
+        self.batches = 0
+        self.renumbered = 0
+        self.marked_read = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.flush_failures = 0
+        self.last_flush_ms = 0.0
+
+    async def write(self, match_id: uuid.UUID, sender_id: uuid.UUID, content: str) -> Message:
+        if len(self._pending) >= self.max_pending:
+            # Backpressure: the database is falling behind, drain before queueing more
+            await self.flush()
+            if len(self._pending) >= self.max_pending:
+                # Still full, so the flush failed: refuse rather than ack messages
+                # that would only grow the buffer without bound
+                self.rejected += 1
+                raise RuntimeError("Chat message buffer full, database unavailable")
+
+        row = {
+            "id": uuid.uuid4(),
+            "match_id": match_id,
+            "sender_id": sender_id,
+            "content": content,
+            "seq": await self._next_seq(match_id),
+            "is_read": False,
+            "created_at": datetime.now(timezone.utc),
+        }
+        row["updated_at"] = row["created_at"]
+
+        done = asyncio.get_running_loop().create_future() if self.durability == "flush" else None
+        self._pending.append((row, done))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        if done is not None:
+            try:
+                await asyncio.wait_for(done, timeout=self.flush_timeout)
+            except asyncio.TimeoutError:
+                # wait_for cancelled the future; withdraw the message if it is still
+                # queued, so the client's retry doesn't store it twice
+                self._pending = [entry for entry in self._pending if entry[1] is not done]
+                self.timed_out += 1
+                raise RuntimeError("Chat message not committed in time, database unavailable")
+        # Transient instance, never attached to a session
+        return Message(**row)
+
+    async def _next_seq(self, match_id: uuid.UUID, floor: Optional[int] = None) -> int:
+        """
+        Next sequence number for the match, from a Redis counter shared by all workers,
+        continuing past `floor` if given.
+        Raises if Redis is unavailable: numbering can't be continued safely without it.
+        """
+        redis = await get_redis_pool()
+        keys = [_seq_key(match_id), _issued_key(match_id)]
+        ttls = [SEQ_KEY_TTL_SECONDS, SEQ_ISSUED_TTL_SECONDS]
+        if floor is None:
+            seq = await redis.eval(_NEXT_SEQ_LUA, 2, *keys, *ttls)
+            if seq is not None:
+                return int(seq)
+
+        # Counter and issued mark both gone, or a seq collided: continue from the
+        # highest number already used, stored or still buffered here. Rows buffered
+        # on other workers can still collide; _insert renumbers those.
+        async with AsyncSessionLocal() as db:
+            stored = (await db.execute(
+                select(func.max(Message.seq)).where(Message.match_id == match_id)
+            )).scalar()
+        buffered = [row["seq"] for row, _ in self._in_flight + self._pending if row["match_id"] == match_id]
+        floor = max([floor or 0, stored or 0, *buffered])
+        return int(await redis.eval(_NEXT_SEQ_LUA, 2, *keys, *ttls, floor))
+
+    async def record_read(self, match_id: uuid.UUID, reader_id: uuid.UUID, up_to_seq: int) -> None:
+        """
+        Records that `reader_id` has read the match up to `up_to_seq`. Rows it covers
+        that are still buffered on some worker are marked read when inserted, so
+        they don't land unread after the reader's counter was cleared. Must run
+        before the mark-read UPDATE: a row committed before its mark could be seen
+        is then covered by that UPDATE instead.
+        """
+        try:
+            redis = await get_redis_pool()
+            await redis.eval(
+                _RECORD_READ_LUA, 1, _read_marks_key(match_id), str(reader_id), up_to_seq, READ_MARK_TTL_SECONDS
+            )
+        except Exception as e:
+            logger.warning("Chat read mark for match %s not recorded: %s", match_id, e)
+
+    async def issued_seq(self, match_id: uuid.UUID) -> Optional[int]:
+        """
+        Highest seq handed out for the match on any worker, stored or not, or None
+        if unknown (Redis unavailable).
+        """
+        try:
+            redis = await get_redis_pool()
+            return int(await redis.get(_issued_key(match_id)) or 0)
+        except Exception as e:
+            logger.warning("Chat issued seq for match %s unavailable: %s", match_id, e)
+            return None
+
+    async def _apply_read_marks(self, rows: List[dict]) -> None:
+        # Runs after the rows committed, so a mark recorded before this read is
+        # seen here, and one recorded after it is followed by an UPDATE that sees them
+        if not rows:
+            return
+        match_ids = list({row["match_id"] for row in rows})
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=False) as pipe:
+                for match_id in match_ids:
+                    pipe.hgetall(_read_marks_key(match_id))
+                marks = dict(zip(match_ids, await pipe.execute()))
+
+            readers = {}
+            for row in rows:
+                for reader_id, up_to_seq in marks[row["match_id"]].items():
+                    if reader_id != str(row["sender_id"]) and int(up_to_seq) >= row["seq"]:
+                        readers[row["id"]] = uuid.UUID(reader_id)
+            if not readers:
+                return
+
+            async with AsyncSessionLocal() as db:
+                marked = (await db.execute(
+                    update(Message)
+                    .where(Message.id.in_(list(readers)), Message.is_read == False)
+                    .values(is_read=True)
+                    .returning(Message.id, Message.match_id)
+                )).all()
+                await db.commit()
+        except Exception as e:
+            logger.warning("Chat read marks not applied to %s new messages: %s", len(rows), e)
+            return
+
+        self.marked_read += len(marked)
+        counts: dict[tuple[uuid.UUID, uuid.UUID], int] = {}
+        for message_id, match_id in marked:
+            key = (readers[message_id], match_id)
+            counts[key] = counts.get(key, 0) + 1
+        for (reader_id, match_id), count in counts.items():
+            await UnreadCounters.mark_read(reader_id, match_id, count, caught_up=False)
+
+    def pending_for(self, match_id: uuid.UUID) -> List[Message]:
+        """
+        Messages for the match that are queued but not yet committed, oldest first.
+        """
+        return [
+            Message(**row) for row, _ in self._in_flight + self._pending
+            if row["match_id"] == match_id
+        ]
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._pending:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                self._in_flight = batch
+                self._committed = set()
+                started = time.perf_counter()
+                try:
+                    dropped = await self._insert([row for row, _ in batch])
+                except asyncio.CancelledError:
+                    # Shutdown mid-flush: keep the batch for the final flush in close()
+                    self._pending = self._unsaved(batch) + self._pending
+                    raise
+                except Exception as e:
+                    self.flush_failures += 1
+                    logger.warning("Chat message flush failed, retrying later: %s", e)
+                    # Put the batch back in front so order is kept, and stop until the next tick
+                    self._pending = self._unsaved(batch) + self._pending
+                    return
+                finally:
+                    self._in_flight = []
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+                self.batches += 1
+                await self._apply_read_marks([row for row, _ in batch if row["id"] not in dropped])
+                for row, done in batch:
+                    if row["id"] in dropped:
+                        await self._report_drop(row, done)
+                    elif done is not None and not done.done():
+                        done.set_result(None)
+
+    def _unsaved(self, batch: List[tuple[dict, Optional[asyncio.Future]]]) -> List[tuple[dict, Optional[asyncio.Future]]]:
+        """
+        The entries of a failed batch to queue again: not the rows that committed
+        before the failure (a bad row is isolated by inserting one row at a time),
+        nor those whose caller timed out and was told the send failed.
+        """
+        unsaved = []
+        for row, done in batch:
+            if row["id"] in self._committed:
+                if done is not None and not done.done():
+                    done.set_result(None)
+            elif done is None or not done.cancelled():
+                unsaved.append((row, done))
+        return unsaved
+
+    async def _insert(self, rows: List[dict]) -> set[uuid.UUID]:
+        """
+        Inserts the rows, returning the ids of those that had to be dropped.
+        """
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(Message), rows)
+                await db.commit()
+        except IntegrityError as e:
+            if len(rows) == 1:
+                return await self._insert_renumbered(rows[0], e)
+            # Isolate the offending rows so the rest of the batch still lands
+            dropped = set()
+            for row in rows:
+                dropped |= await self._insert([row])
+            return dropped
+        self.written += len(rows)
+        self._committed.update(row["id"] for row in rows)
+        return set()
+
+    async def _insert_renumbered(self, row: dict, error: IntegrityError) -> set[uuid.UUID]:
+        for _ in range(SEQ_CONFLICT_RETRIES):
+            if "uq_messages_match_seq" not in str(error.orig):
+                break
+            # Another worker holds this seq (the counter was lost and re-seeded below
+            # rows it still had buffered): renumber past everything stored and retry
+            old_seq = row["seq"]
+            row["seq"] = await self._next_seq(row["match_id"], floor=old_seq)
+            self.renumbered += 1
+            logger.warning("Chat message %s renumbered from seq %s to %s", row["id"], old_seq, row["seq"])
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(Message), [row])
+                    await db.commit()
+            except IntegrityError as e:
+                error = e
+                continue
+            self.written += 1
+            self._committed.add(row["id"])
+            return set()
+
+        # e.g. the match was deleted after the message was accepted; retrying can't help
+        self.dropped += 1
+        logger.error("Dropping chat message %s: %s", row["id"], error.orig)
+        return {row["id"]}
+
+    async def _report_drop(self, row: dict, done: Optional[asyncio.Future]) -> None:
+        if done is not None and not done.done():
+            # The "flush" caller is still waiting and answers its socket with an error
+            done.set_exception(RuntimeError("Chat message could not be saved"))
+            return
+        # Imported here: chat_service imports this module
+        from services.chat_service import manager
+        # The sender was already acked, so tell every device they're connected on
+        await manager.send_personal_message(
+            {"error": "Message could not be sent.", "id": str(row["id"]), "match_id": str(row["match_id"])},
+            row["sender_id"],
+        )
+
+    async def run(self) -> None:
+        """
+        Flush loop; meant to be run as a lifespan task.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        # Called on shutdown after the flush loop is cancelled
+        await self.flush()
+        for _, done in self._pending:
+            if done is not None and not done.done():
+                done.set_exception(RuntimeError("Chat message writer shut down before flush"))
+        if self._pending:
+            logger.error("Chat message writer shut down with %s unsaved messages", len(self._pending))
+
+    def stats(self) -> dict:
+        return {
+            "durability": self.durability,
+            "pending": len(self._pending),
+            "written": self.written,
+            "batches": self.batches,
+            "renumbered": self.renumbered,
+            "marked_read": self.marked_read,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "flush_failures": self.flush_failures,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+message_writer = MessageWriter(
+    batch_size=settings.CHAT_WRITE_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_FLUSH_INTERVAL,
+    max_pending=settings.CHAT_WRITE_MAX_PENDING,
+    durability=settings.CHAT_WRITE_DURABILITY,
+    flush_timeout=settings.CHAT_WRITE_FLUSH_TIMEOUT,
+)
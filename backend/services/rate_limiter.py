@@ -0,0 +1,98 @@
+import time
+from dataclasses import dataclass
+
+from config.redis import get_redis_pool
+
+# GCRA (generic cell rate algorithm): one key per limited subject holding its
+# "theoretical arrival time" in ms. Each hit pushes it forward by one emission
+# interval; the hit is refused if that would put it more than a window ahead of now.
+# Equivalent to a sliding window of `limit` hits per `window` with no per-hit
+# storage, and uses the Redis clock so nodes with skewed clocks agree.
+# Returns 0 if allowed, else the ms to wait before the next hit would be.
+_GCRA_LUA = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+if new_tat - now > window then
+    return new_tat - window - now
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return 0
+"""
+
+# Process-wide counters for /admin/metrics
+rate_limit_stats = {
+    "local_rejected": 0,
+    "redis_checks": 0,
+    "redis_rejected": 0,
+    "redis_errors": 0,
+}
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    retry_after: float = 0.0
+
+class TokenBucket:
+    """
+    In-process token bucket: `limit` hits per `window` seconds, with bursts of up
+    to `limit`. For state owned by one connection (e.g. a chat socket), where it
+    answers without a network round trip.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, limit: int, window: float):
+        self.rate = limit / window
+        self.capacity = float(limit)
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+
+    def hit(self) -> RateLimitResult:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return RateLimitResult(True)
+        rate_limit_stats["local_rejected"] += 1
+        return RateLimitResult(False, (1 - self.tokens) / self.rate)
+
+class RateLimiter:
+    """
+    Shared limits enforced across every worker and node: one atomic GCRA script
+    call per hit (a single EVALSHA round trip, constant memory per key).
+    """
+
+    def __init__(self):
+        self._script = None
+
+    async def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        """
+        Counts a hit against `key`, allowing `limit` per `window` seconds.
+        Raises if Redis is unavailable; callers decide whether to fail open.
+        """
+        if self._script is None:
+            redis = await get_redis_pool()
+            self._script = redis.register_script(_GCRA_LUA)
+
+        rate_limit_stats["redis_checks"] += 1
+        window_ms = window * 1000
+        interval_ms = max(window_ms // limit, 1)
+        try:
+            wait_ms = await self._script(keys=[key], args=[interval_ms, window_ms])
+        except Exception:
+            rate_limit_stats["redis_errors"] += 1
+            raise
+        if wait_ms:
+            rate_limit_stats["redis_rejected"] += 1
+            return RateLimitResult(False, int(wait_ms) / 1000)
+        return RateLimitResult(True)
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,181 @@
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from config.redis import get_redis_pool
+from config.settings import settings
+from models.message import Message
+from services.message_writer import SETTLE_SECONDS
+
+# Process-wide counters for /admin/metrics
+recent_messages_stats = {
+    "hits": 0,
+    "misses": 0,
+    "stale": 0,
+    "errors": 0,
+}
+
+def _list_key(match_id: uuid.UUID) -> str:
+    return f"chat:recent:{match_id}"
+
+def _read_key(match_id: uuid.UUID) -> str:
+    # reader id -> highest seq they marked read
+    return f"chat:recent:{match_id}:read"
+
+def _seeded_key(match_id: uuid.UUID) -> str:
+    # "<highest seq in the seed>:<1 if the seed was the whole history>"
+    return f"chat:recent:{match_id}:seeded"
+
+def _seq_key(match_id: uuid.UUID) -> str:
+    # The match's message counter, maintained by services/message_writer.py
+    return f"chat:seq:{match_id}"
+
+def _encode(msg: Message) -> str:
+    return json.dumps({
+        "id": str(msg.id),
+        "match_id": str(msg.match_id),
+        "sender_id": str(msg.sender_id),
+        "content": msg.content,
+        "seq": msg.seq,
+        "is_read": bool(msg.is_read),
+        "created_at": msg.created_at.isoformat(),
+    })
+
+def _decode(raw: str) -> Message:
+    row = json.loads(raw)
+    return Message(
+        id=uuid.UUID(row["id"]),
+        match_id=uuid.UUID(row["match_id"]),
+        sender_id=uuid.UUID(row["sender_id"]),
+        content=row["content"],
+        seq=row["seq"],
+        is_read=row["is_read"],
+        created_at=datetime.fromisoformat(row["created_at"]),
+    )
+
+class RecentMessages:
+    """
+    The newest CHAT_RECENT_CACHE_SIZE messages of each match, as a capped Redis
+    list (newest first), so opening a chat doesn't query Postgres. Sends push onto
+    it, mark-read records a per-reader watermark next to it, and deleting a
+    message drops it. A cached page is only served if every message sent since the
+    seed was pushed (checked against the match's seq counter), i.e. nothing was
+    missed; otherwise the caller reads the database and re-seeds.
+    """
+
+    @staticmethod
+    async def page(match_id: uuid.UUID, limit: int) -> List[Message] | None:
+        """
+        The newest `limit` messages, newest first, or None on a miss.
+        """
+        if limit > settings.CHAT_RECENT_CACHE_SIZE:
+            recent_messages_stats["misses"] += 1
+            return None
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.get(_seeded_key(match_id))
+                pipe.lrange(_list_key(match_id), 0, -1)
+                pipe.get(_seq_key(match_id))
+                pipe.hgetall(_read_key(match_id))
+                seeded, entries, current_seq, watermarks = await pipe.execute()
+        except Exception as e:
+            recent_messages_stats["errors"] += 1
+            print(f"Recent messages cache read failed: {e}")
+            return None
+
+        if seeded is None:
+            recent_messages_stats["misses"] += 1
+            return None
+        seeded_seq, complete = (int(value) for value in seeded.split(":"))
+
+        # Concurrent pushes from different workers may land slightly out of order,
+        # and a push racing a seed can duplicate a message
+        unique = {}
+        for raw in entries:
+            msg = _decode(raw)
+            unique[msg.id] = msg
+        messages = sorted(unique.values(), key=lambda msg: msg.seq, reverse=True)
+
+        # Everything up to seeded_seq is settled in the database; every seq after it
+        # must be present exactly once (deleted messages leave gaps below seeded_seq,
+        # which is fine)
+        newer = sum(1 for msg in messages if msg.seq > seeded_seq)
+        if newer != int(current_seq or 0) - seeded_seq:
+            recent_messages_stats["stale"] += 1
+            return None
+        # Short of `limit` is only a full answer if the seed held the whole history
+        if len(messages) < limit and not complete:
+            recent_messages_stats["misses"] += 1
+            return None
+
+        recent_messages_stats["hits"] += 1
+        messages = messages[:limit]
+        for msg in messages:
+            msg.is_read = msg.is_read or any(
+                int(up_to_seq) >= msg.seq
+                for reader_id, up_to_seq in watermarks.items() if reader_id != str(msg.sender_id)
+            )
+        return messages
+
+    @staticmethod
+    async def seed(match_id: uuid.UUID, messages: List[Message], complete: bool) -> None:
+        """
+        Replaces the cached list with `messages` (the newest ones, newest first).
+        `complete` means they are the match's entire history.
+        """
+        messages = messages[:settings.CHAT_RECENT_CACHE_SIZE]
+        # Messages younger than SETTLE_SECONDS may still be unflushed on another worker,
+        # so the seed doesn't vouch for them and they are checked like pushed ones
+        settled = datetime.now(timezone.utc) - timedelta(seconds=SETTLE_SECONDS)
+        seeded_seq = max((msg.seq for msg in messages if msg.created_at <= settled), default=0)
+        ttl = settings.CHAT_RECENT_CACHE_TTL_SECONDS
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=True) as pipe:
+                # The read watermarks only ever move forward, so they stay valid
+                pipe.delete(_list_key(match_id))
+                if messages:
+                    pipe.rpush(_list_key(match_id), *[_encode(msg) for msg in messages])
+                    pipe.expire(_list_key(match_id), ttl)
+                pipe.setex(_seeded_key(match_id), ttl, f"{seeded_seq}:{int(complete)}")
+                await pipe.execute()
+        except Exception as e:
+            print(f"Recent messages cache seed failed: {e}")
+
+    @staticmethod
+    async def push(msg: Message) -> None:
+        # Only extends a list that is already cached; a missing one (including a seeded
+        # empty match) is seeded on the next read
+        key = _list_key(msg.match_id)
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.lpushx(key, _encode(msg))
+                pipe.ltrim(key, 0, settings.CHAT_RECENT_CACHE_SIZE - 1)
+                pipe.expire(key, settings.CHAT_RECENT_CACHE_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Recent messages cache push failed: {e}")
+
+    @staticmethod
+    async def mark_read(match_id: uuid.UUID, reader_id: uuid.UUID, up_to_seq: int) -> None:
+        try:
+            redis = await get_redis_pool()
+            current = await redis.hget(_read_key(match_id), str(reader_id))
+            if current is None or int(current) < up_to_seq:
+                async with redis.pipeline(transaction=True) as pipe:
+                    pipe.hset(_read_key(match_id), str(reader_id), up_to_seq)
+                    pipe.expire(_read_key(match_id), settings.CHAT_RECENT_CACHE_TTL_SECONDS)
+                    await pipe.execute()
+        except Exception as e:
+            print(f"Recent messages cache update failed: {e}")
+
+    @staticmethod
+    async def invalidate(match_id: uuid.UUID) -> None:
+        try:
+            redis = await get_redis_pool()
+            await redis.delete(_list_key(match_id), _seeded_key(match_id), _read_key(match_id))
+        except Exception as e:
+            print(f"Recent messages cache invalidation failed: {e}")
@@ -1,9 +1,139 @@
 import uuid
 from datetime import date, timedelta
+from typing import Dict, List, Set
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+
+from config.redis import get_redis_pool
 from models.streak import UserStreak
 
+# Milestone Badges
+STREAK_MILESTONES = {
+    3: "3_day_fire",
+    7: "7_day_flame",
+    14: "14_day_inferno",
+    30: "30_day_legend"
+}
+
+# Days a pending set is kept in Redis after its last addition
+PENDING_RETENTION_DAYS = 2
+
+def _seen_key(day: date) -> str:
+    return f"streak:seen:{day.isoformat()}"
+
+def _pending_key(day: date) -> str:
+    return f"streak:pending:{day.isoformat()}"
+
+class DailyActivityGate:
+    """
+    "Seen today" gate in front of the streak table.
+    Only the first request of the day per user does any work: a local set
+    short-circuits repeats in this worker, a per-day Redis set dedupes across
+    workers, and first sightings are queued for the batched streak flush.
+    """
+
+    def __init__(self):
+        self._day = date.today()
+        self._seen_locally: Set[uuid.UUID] = set()
+        # Used only when Redis is unreachable, drained by the same flush job
+        self._local_pending: Dict[date, Set[uuid.UUID]] = {}
+
+    async def record(self, user_id: uuid.UUID) -> None:
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._seen_locally = set()
+
+        if user_id in self._seen_locally:
+            return
+        self._seen_locally.add(user_id)
+
+        try:
+            redis = await get_redis_pool()
+            if await redis.sadd(_seen_key(today), str(user_id)):
+                async with redis.pipeline(transaction=True) as pipe:
+                    pipe.expire(_seen_key(today), 2 * 86400)
+                    pipe.sadd(_pending_key(today), str(user_id))
+                    pipe.expire(_pending_key(today), PENDING_RETENTION_DAYS * 86400)
+                    await pipe.execute()
+        except Exception as e:
+            print(f"Streak activity gate redis error: {e}")
+            self._local_pending.setdefault(today, set()).add(user_id)
+
+    async def pop_pending(self, day: date, count: int) -> List[uuid.UUID]:
+        user_ids = set(self._local_pending.pop(day, set()))
+        try:
+            redis = await get_redis_pool()
+            # SPOP hands each id to exactly one flusher, even with several workers running the job
+            popped = await redis.spop(_pending_key(day), count)
+            user_ids.update(uuid.UUID(uid) for uid in popped or [])
+        except Exception as e:
+            print(f"Streak pending pop redis error: {e}")
+        return list(user_ids)
+
+    def pending_days(self, today: date) -> List[date]:
+        """
+        Every day that may still have activity to apply, oldest first: the days
+        Redis still holds pending sets for, plus any held locally after a failure.
+        """
+        days = {today - timedelta(days=n) for n in range(PENDING_RETENTION_DAYS + 1)}
+        days.update(day for day in self._local_pending if day <= today)
+        return sorted(days)
+
+    def requeue(self, day: date, user_ids: List[uuid.UUID]) -> None:
+        # Keeps a failed batch for the next flush instead of dropping it
+        self._local_pending.setdefault(day, set()).update(user_ids)
+
+activity_gate = DailyActivityGate()
+
+# Computes the new streak for every user in the batch from their current row,
+# then upserts all rows at once. Days at or before last_active_date are no-ops.
+_APPLY_DAILY_ACTIVITY_SQL = """
+WITH activity AS (
+    SELECT u.id AS user_id,
+           s.current_streak,
+           s.longest_streak,
+           s.last_active_date,
+           COALESCE(s.badges, '[]'::jsonb) AS badges
+    FROM unnest(CAST(:user_ids AS uuid[])) AS ids(user_id)
+    JOIN users u ON u.id = ids.user_id
+    LEFT JOIN user_streaks s ON s.user_id = ids.user_id
+),
+computed AS (
+    SELECT user_id, longest_streak, last_active_date, badges,
+           CASE
+               WHEN last_active_date >= CAST(:day AS date) THEN current_streak
+               WHEN last_active_date = CAST(:day AS date) - 1 THEN current_streak + 1
+               ELSE 1
+           END AS new_streak
+    FROM activity
+)
+INSERT INTO user_streaks (id, user_id, current_streak, longest_streak, last_active_date, badges, created_at, updated_at)
+SELECT gen_random_uuid(),
+       c.user_id,
+       c.new_streak,
+       GREATEST(COALESCE(c.longest_streak, 0), c.new_streak),
+       GREATEST(c.last_active_date, CAST(:day AS date)),
+       CASE
+           WHEN m.badge IS NOT NULL AND NOT c.badges @> jsonb_build_array(m.badge)
+           THEN c.badges || jsonb_build_array(m.badge)
+           ELSE c.badges
+       END,
+       now(),
+       now()
+FROM computed c
+LEFT JOIN ({milestones}) AS m(days, badge)
+       ON m.days = c.new_streak
+      AND (c.last_active_date IS NULL OR c.last_active_date < CAST(:day AS date))
+ON CONFLICT (user_id) DO UPDATE SET
+    current_streak = EXCLUDED.current_streak,
+    longest_streak = EXCLUDED.longest_streak,
+    last_active_date = EXCLUDED.last_active_date,
+    badges = EXCLUDED.badges,
+    updated_at = EXCLUDED.updated_at
+"""
+
 class StreakService:
     def __init__(self, db: AsyncSession):
         self.db = db
@@ -12,7 +142,7 @@ class StreakService:
         qry = select(UserStreak).where(UserStreak.user_id == user_id)
         result = await self.db.execute(qry)
         streak = result.scalars().first()
-        
+
         if not streak:
             streak = UserStreak(
                 user_id=user_id,
@@ -23,57 +153,26 @@ class StreakService:
             )
             self.db.add(streak)
             await self.db.flush()
-            
+
         return streak
 
-    async def process_daily_activity(self, user_id: uuid.UUID) -> None:
+    async def apply_daily_activity(self, user_ids: List[uuid.UUID], day: date) -> None:
         """
-        Background task to update user's daily streak.
-        Should be called once per authenticated request, but only performs DB updates if the date has changed.
+        Applies streak increments, resets and milestone badges for a batch of
+        users that were active on `day`, in a single statement.
         """
-        today = date.today()
-        
-        streak = await self.get_or_create_streak(user_id)
-        
-        # If already logged activity today, do nothing
-        if streak.last_active_date == today:
+        if not user_ids:
             return
-            
-        # Calculate streak logic
-        yesterday = today - timedelta(days=1)
-        
-        if streak.last_active_date == yesterday:
-            # Continuing a streak
-            streak.current_streak += 1
-        else:
-            # Breaking a streak or starting a brand new one
-            streak.current_streak = 1
-            
-        # Update longest streak
-        if streak.current_streak > streak.longest_streak:
-            streak.longest_streak = streak.current_streak
-            
-        # Milestone Badges
-        milestones = {
-            3: "3_day_fire",
-            7: "7_day_flame",
-            14: "14_day_inferno",
-            30: "30_day_legend"
-        }
-        
-        current_badges = streak.badges if streak.badges else []
-        
-        if streak.current_streak in milestones:
-            new_badge = milestones[streak.current_streak]
-            if new_badge not in current_badges:
-                current_badges.append(new_badge)
-                # Ensure SQLAlchemy detects the JSONB array mutation
-                from sqlalchemy.orm.attributes import flag_modified
-                streak.badges = current_badges
-                flag_modified(streak, "badges")
-
-        streak.last_active_date = today
-        
+
+        params = {"user_ids": user_ids, "day": day}
+        milestone_rows = []
+        for i, (days, badge) in enumerate(sorted(STREAK_MILESTONES.items())):
+            milestone_rows.append(f"(CAST(:m_days_{i} AS integer), CAST(:m_badge_{i} AS text))")
+            params[f"m_days_{i}"] = days
+            params[f"m_badge_{i}"] = badge
+
+        stmt = text(_APPLY_DAILY_ACTIVITY_SQL.format(milestones="VALUES " + ", ".join(milestone_rows)))
+        await self.db.execute(stmt, params)
         await self.db.commit()
 
     async def get_streak_info(self, user_id: uuid.UUID) -> dict:
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+
+from config.redis import get_redis_pool, run_subscriber
+from config.settings import settings
+
+# Redis remains the source of truth:
+#   bl:{jti}       -> per-token key with TTL (kept for compatibility with older workers)
+#   revoked_jtis   -> sorted set of jti scored by expiry epoch, used for bulk syncs
+REVOKED_INDEX_KEY = "revoked_jtis"
+REVOCATION_CHANNEL = "token_revocation:revoked"
+# Set once the pre-index bl:{jti} keys have been copied into the index, by any worker
+LEGACY_MIGRATED_KEY = "revoked_jtis:legacy_migrated"
+LEGACY_MIGRATING_KEY = "revoked_jtis:legacy_migrating"
+
+class TokenRevocationList:
+    """
+    Local mirror of revoked token JTIs so the common "not revoked" answer
+    never leaves the process. Kept current by pub/sub pushes from /auth/logout
+    plus a periodic full sync; only consults Redis directly if the mirror is stale.
+    """
+
+    def __init__(self, sync_interval: float, max_staleness: float, fail_mode: str):
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.fail_closed = fail_mode == "closed"
+        self._revoked: Dict[str, float] = {}
+        self._last_sync: Optional[float] = None
+        self._legacy_scan_done = False
+
+        self.local_checks = 0
+        self.local_revoked_hits = 0
+        self.redis_fallbacks = 0
+        self.redis_fallback_revoked = 0
+        self.unavailable_checks = 0
+        self.sync_count = 0
+        self.sync_failures = 0
+
+    def _is_fresh(self) -> bool:
+        if self._last_sync is None:
+            return False
+        return time.monotonic() - self._last_sync <= self.max_staleness
+
+    def _remember(self, jti: str, expires_at: float) -> None:
+        if expires_at > time.time():
+            self._revoked[jti] = expires_at
+
+    async def revoke(self, jti: str, ttl_seconds: int) -> None:
+        expires_at = time.time() + ttl_seconds
+        self._remember(jti, expires_at)
+
+        redis = await get_redis_pool()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.setex(f"bl:{jti}", ttl_seconds, "1")
+            pipe.zadd(REVOKED_INDEX_KEY, {jti: expires_at})
+            pipe.publish(REVOCATION_CHANNEL, f"{jti}:{expires_at}")
+            await pipe.execute()
+
+    async def is_revoked(self, jti: str) -> bool:
+        expires_at = self._revoked.get(jti)
+        if expires_at is not None and expires_at > time.time():
+            self.local_revoked_hits += 1
+            return True
+
+        if self._is_fresh():
+            self.local_checks += 1
+            return False
+
+        # Mirror is stale (sync loop can't reach Redis): ask Redis directly
+        self.redis_fallbacks += 1
+        try:
+            redis = await get_redis_pool()
+            revoked = bool(await redis.get(f"bl:{jti}"))
+        except Exception as e:
+            self.unavailable_checks += 1
+            print(f"Token revocation check failed: {e}")
+            if self.fail_closed:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication temporarily unavailable",
+                )
+            return False
+
+        if revoked:
+            self.redis_fallback_revoked += 1
+        return revoked
+
+    async def _migrate_legacy_keys(self, redis) -> bool:
+        """
+        Tokens revoked before the index existed only have a bl:{jti} key. Copies
+        them into the index once for the whole deployment: the first worker to
+        take the lock scans, and the marker stops every later startup from
+        scanning the keyspace again. Returns whether the migration is done; while
+        it isn't, every sync tries again, so a worker that dies holding the lock
+        is taken over once the lock expires.
+        """
+        if await redis.exists(LEGACY_MIGRATED_KEY):
+            return True
+        if not await redis.set(LEGACY_MIGRATING_KEY, "1", nx=True, ex=300):
+            return False
+
+        cursor = 0
+        while True:
+            cursor, keys = await redis.scan(cursor, match="bl:*", count=500)
+            if keys:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for key in keys:
+                        pipe.ttl(key)
+                    ttls = await pipe.execute()
+                now = time.time()
+                entries = {key[len("bl:"):]: now + ttl for key, ttl in zip(keys, ttls) if ttl > 0}
+                if entries:
+                    await redis.zadd(REVOKED_INDEX_KEY, entries)
+            if cursor == 0:
+                break
+        await redis.set(LEGACY_MIGRATED_KEY, "1")
+        await redis.delete(LEGACY_MIGRATING_KEY)
+        return True
+
+    async def sync(self) -> None:
+        redis = await get_redis_pool()
+        now = time.time()
+        if not self._legacy_scan_done:
+            self._legacy_scan_done = await self._migrate_legacy_keys(redis)
+
+        await redis.zremrangebyscore(REVOKED_INDEX_KEY, 0, now)
+        entries = await redis.zrangebyscore(REVOKED_INDEX_KEY, now, "+inf", withscores=True)
+
+        # Merge rather than replace: a push may have landed while the range read was in flight
+        revoked = {jti: expires_at for jti, expires_at in entries}
+        for jti, expires_at in self._revoked.items():
+            if expires_at > now:
+                revoked.setdefault(jti, expires_at)
+        self._revoked = revoked
+        self._last_sync = time.monotonic()
+        self.sync_count += 1
+
+    async def sync_forever(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.sync_failures += 1
+                print(f"Token revocation sync failed: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def _on_revoked(self, data: str) -> None:
+        jti, _, expires_at = data.rpartition(":")
+        try:
+            self._remember(jti, float(expires_at))
+        except ValueError:
+            pass
+
+    async def listen(self) -> None:
+        await run_subscriber(REVOCATION_CHANNEL, self._on_revoked)
+
+    def stats(self) -> dict:
+        return {
+            "fail_mode": "closed" if self.fail_closed else "open",
+            "revoked_tokens": len(self._revoked),
+            "seconds_since_sync": round(time.monotonic() - self._last_sync, 1) if self._last_sync is not None else None,
+            "local_checks": self.local_checks,
+            "local_revoked_hits": self.local_revoked_hits,
+            "redis_fallbacks": self.redis_fallbacks,
+            "redis_fallback_revoked": self.redis_fallback_revoked,
+            "unavailable_checks": self.unavailable_checks,
+            "sync_count": self.sync_count,
+            "sync_failures": self.sync_failures,
+            # The mirror is an exact set, so a local "revoked" answer is never a false positive
+            "false_positive_rate": 0.0,
+        }
+
+revocation_list = TokenRevocationList(
+    sync_interval=settings.TOKEN_REVOCATION_SYNC_INTERVAL,
+    max_staleness=settings.TOKEN_REVOCATION_MAX_STALENESS,
+    fail_mode=settings.TOKEN_REVOCATION_FAIL_MODE,
+)
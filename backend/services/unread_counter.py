@@ -0,0 +1,110 @@
+import uuid
+from sqlalchemy import func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config.redis import get_redis_pool
+from models.match import Match
+from models.message import Message
+
+# Rebuilt from the database after this long, bounding drift from missed updates
+UNREAD_TTL_SECONDS = 86400
+
+def _hash_key(user_id: uuid.UUID) -> str:
+    return f"chat:unread:{user_id}"
+
+def _ready_key(user_id: uuid.UUID) -> str:
+    return f"chat:unread:{user_id}:ready"
+
+# Increments only a hash that has been built (the ready key exists), keeping the
+# hash's TTL in step with it, so users who never come back don't leave hashes
+# that never expire. KEYS: hash, ready. ARGV: match id
+_INCREMENT_LUA = """
+local ttl = redis.call('TTL', KEYS[2])
+if ttl <= 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+redis.call('EXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+class UnreadCounters:
+    """
+    Per-user unread message counts, one Redis hash per user (field = match id,
+    value = messages from the peer not yet read). Sending a message increments
+    the recipient's field and marking read decrements it, so the inbox badge is
+    one hash read instead of a COUNT over messages. The database's is_read flags
+    stay the source of truth; the hash is rebuilt from them when missing.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _counts_from_db(self, user_id: uuid.UUID) -> dict[uuid.UUID, int]:
+        qry = (
+            select(Message.match_id, func.count())
+            .join(Match, Match.id == Message.match_id)
+            .where(
+                or_(Match.user1_id == user_id, Match.user2_id == user_id),
+                Match.is_active == True,
+                Message.sender_id != user_id,
+                Message.is_read == False,
+            )
+            .group_by(Message.match_id)
+        )
+        return {match_id: count for match_id, count in (await self.db.execute(qry)).all()}
+
+    async def load(self, user_id: uuid.UUID) -> dict[uuid.UUID, int] | None:
+        """
+        Unread count per match (matches with nothing unread may be absent),
+        rebuilding the hash from the database if needed.
+        Returns None if Redis is unavailable so the caller can count in SQL.
+        """
+        try:
+            redis = await get_redis_pool()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.exists(_ready_key(user_id))
+                pipe.hgetall(_hash_key(user_id))
+                ready, counts = await pipe.execute()
+
+            if ready:
+                return {uuid.UUID(match_id): max(int(count), 0) for match_id, count in counts.items()}
+
+            counts = await self._counts_from_db(user_id)
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(_hash_key(user_id))
+                if counts:
+                    pipe.hset(_hash_key(user_id), mapping={str(match_id): count for match_id, count in counts.items()})
+                    pipe.expire(_hash_key(user_id), UNREAD_TTL_SECONDS)
+                pipe.setex(_ready_key(user_id), UNREAD_TTL_SECONDS, "1")
+                await pipe.execute()
+            return counts
+        except Exception as e:
+            print(f"Unread counter load failed: {e}")
+            return None
+
+    @staticmethod
+    async def increment(user_id: uuid.UUID, match_id: uuid.UUID) -> None:
+        # If the hash hasn't been built yet nothing is written: the next load builds it
+        try:
+            redis = await get_redis_pool()
+            await redis.eval(_INCREMENT_LUA, 2, _hash_key(user_id), _ready_key(user_id), str(match_id))
+        except Exception as e:
+            print(f"Unread counter update failed: {e}")
+
+    @staticmethod
+    async def mark_read(user_id: uuid.UUID, match_id: uuid.UUID, count: int, caught_up: bool) -> None:
+        """
+        Records `count` messages as read. `caught_up` means nothing in the match is
+        left unread, so the field is cleared outright instead of decremented.
+        """
+        try:
+            redis = await get_redis_pool()
+            if caught_up:
+                await redis.hdel(_hash_key(user_id), str(match_id))
+            elif count:
+                if await redis.hincrby(_hash_key(user_id), str(match_id), -count) <= 0:
+                    await redis.hdel(_hash_key(user_id), str(match_id))
+        except Exception as e:
+            print(f"Unread counter update failed: {e}")
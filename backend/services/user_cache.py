@@ -0,0 +1,30 @@
+import uuid
+from typing import Optional
+
+from config.settings import settings
+from models.user import User
+from services.local_cache import InvalidatedCache
+
+# Only identity and moderation flags are cached. Never the password hash or relationships.
+_CACHED_FIELDS = ("id", "email", "is_active", "is_verified", "is_shadowbanned", "role", "created_at", "updated_at")
+
+class UserCache(InvalidatedCache[uuid.UUID, dict]):
+    """
+    Per-worker cache of authenticated user snapshots, invalidated across workers
+    whenever a write changes the user.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        super().__init__("user_cache", max_size, ttl_seconds, decode_key=uuid.UUID)
+
+    def get_user(self, user_id: uuid.UUID) -> Optional[User]:
+        snapshot = self.get(user_id)
+        if snapshot is None:
+            return None
+        # Fresh transient instance per request so handlers can't mutate shared state
+        return User(**snapshot)
+
+    def set_user(self, user: User) -> None:
+        self.set(user.id, {field: getattr(user, field) for field in _CACHED_FIELDS})
+
+user_cache = UserCache(max_size=settings.USER_CACHE_MAX_SIZE, ttl_seconds=settings.USER_CACHE_TTL_SECONDS)
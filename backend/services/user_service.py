@@ -5,9 +5,63 @@ import uuid
 
 from models.user import User, UserRole
 from models.profile import Profile
+from models.photo import Photo
 from schemas.user import UserCreate, UserAccountUpdate
 from schemas.profile import ProfileCreate, ProfileUpdate
-from utils.security import get_password_hash
+from utils.security import get_password_hash_async
+from services.user_cache import user_cache
+from utils.location import (
+    geo_cell_coords, geo_cell_id, geo_max_ring, geo_ring_cell_ranges, geo_ring_reach
+)
+
+# Upper bound on extra rows fetched per batch to cover users dropped by the exclusion filter
+DISCOVER_MAX_OVERFETCH = 500
+
+def _profile_row_query():
+    """
+    Projection of exactly the ProfileResponse fields, with the user's photos
+    aggregated into a JSON array by the same query. Rows come back as plain
+    mappings that can be encoded directly, without building ORM objects.
+    """
+    from sqlalchemy import JSON, func, literal_column
+    from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+    # Keys are inlined so Postgres doesn't have to infer types for bound parameters
+    photo = func.json_build_object(*[
+        arg
+        for key, column in (
+            ("id", Photo.id),
+            ("user_id", Photo.user_id),
+            ("url", Photo.url),
+            ("is_primary", Photo.is_primary),
+            ("order", Photo.order),
+        )
+        for arg in (literal_column(f"'{key}'"), column)
+    ])
+    photos = (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(photo, Photo.order)),
+            literal_column("'[]'::json"),
+            type_=JSON,
+        ))
+        .where(Photo.user_id == Profile.user_id)
+        .scalar_subquery()
+    )
+    return select(
+        Profile.id,
+        Profile.user_id,
+        Profile.first_name,
+        Profile.last_name,
+        Profile.bio,
+        Profile.birth_date,
+        Profile.gender,
+        Profile.interested_in,
+        Profile.latitude,
+        Profile.longitude,
+        Profile.phone_number,
+        Profile.interests,
+        photos.label("photos"),
+    )
 
 class UserService:
     def __init__(self, db: AsyncSession):
@@ -27,14 +81,30 @@ class UserService:
         )
         return result.scalars().first()
 
+    async def get_auth_user(self, user_id: uuid.UUID) -> User | None:
+        """
+        Identity lookup for authentication. Served from the local user cache
+        when possible; a miss costs one query (no streak relationship).
+        """
+        cached = user_cache.get_user(user_id)
+        if cached is not None:
+            return cached
+
+        result = await self.db.execute(select(User).where(User.id == user_id))
+        user = result.scalars().first()
+        if user:
+            user_cache.set_user(user)
+        return user
+
     async def create_user(self, user_in: UserCreate) -> User:
         user = await self.get_user_by_email(user_in.email)
         if user:
             if not user.is_active:
                 # Reactivation Flow!
                 user.is_active = True
-                user.hashed_password = get_password_hash(user_in.password)
+                user.hashed_password = await get_password_hash_async(user_in.password)
                 await self.db.commit()
+                await user_cache.invalidate(user.id)
                 await self.db.refresh(user)
                 return user
             
@@ -45,7 +115,7 @@ class UserService:
         
         db_user = User(
             email=user_in.email,
-            hashed_password=get_password_hash(user_in.password),
+            hashed_password=await get_password_hash_async(user_in.password),
             is_active=True,
             is_verified=True,
             role=UserRole.USER,
@@ -67,6 +137,7 @@ class UserService:
             user.email = update_data.email
             
         await self.db.commit()
+        await user_cache.invalidate(user_id)
         await self.db.refresh(user)
         return user
 
@@ -77,6 +148,7 @@ class UserService:
         
         user.is_active = False
         await self.db.commit()
+        await user_cache.invalidate(user_id)
         await self.db.refresh(user)
         return user
 
@@ -97,25 +169,21 @@ class UserService:
             gender=profile_in.gender,
             interested_in=profile_in.interested_in,
             latitude=profile_in.latitude,
-            longitude=profile_in.longitude
+            longitude=profile_in.longitude,
+            geo_cell=geo_cell_id(profile_in.latitude, profile_in.longitude)
         )
         self.db.add(db_profile)
         await self.db.commit()
         await self.db.refresh(db_profile)
         return db_profile
 
-    async def get_profile(self, user_id: uuid.UUID) -> Profile | None:
-        from sqlalchemy.orm import selectinload
-        result = await self.db.execute(
-            select(Profile)
-            .join(User, Profile.user_id == User.id)
-            .options(selectinload(Profile.user).selectinload(User.photos))
-            .where(Profile.user_id == user_id)
-        )
-        profile = result.scalars().first()
-        if profile:
-            setattr(profile, 'photos', getattr(profile.user, 'photos', []))
-        return profile
+    async def get_profile_row(self, user_id: uuid.UUID) -> dict | None:
+        """
+        The user's profile as a plain dict shaped like ProfileResponse.
+        """
+        result = await self.db.execute(_profile_row_query().where(Profile.user_id == user_id))
+        row = result.first()
+        return dict(row._mapping) if row else None
 
     async def update_profile(self, user_id: uuid.UUID, profile_update: ProfileUpdate) -> Profile:
         result = await self.db.execute(select(Profile).where(Profile.user_id == user_id))
@@ -123,15 +191,72 @@ class UserService:
         if not profile:
             raise HTTPException(status_code=404, detail="Profile not found")
             
+        ranking_inputs = (profile.gender, profile.interested_in, profile.geo_cell)
         update_data = profile_update.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(profile, field, value)
+        if "latitude" in update_data or "longitude" in update_data:
+            profile.geo_cell = geo_cell_id(profile.latitude, profile.longitude)
             
         await self.db.commit()
+        # Queued candidates (and cursors into them) stay valid for GPS jitter within the same cell
+        if (profile.gender, profile.interested_in, profile.geo_cell) != ranking_inputs:
+            from services.discover_queue import DiscoverQueue
+            await DiscoverQueue.invalidate(user_id)
         await self.db.refresh(profile)
         return profile
 
-    async def get_discover_feed(
+    async def _nearest_candidates(
+        self,
+        candidates,
+        latitude: float,
+        longitude: float,
+        limit: int,
+        after: tuple[float, uuid.UUID] | None = None,
+    ) -> list[tuple[uuid.UUID, float]]:
+        """
+        Nearest-first search over the spatial grid. Starts with the user's own cell
+        and doubles the ring of cells until the `limit` closest candidates are
+        provably inside the scanned square (or the whole grid is covered).
+        `after` is a (distance, user_id) keyset position to continue from.
+        """
+        from sqlalchemy import or_, and_
+
+        raw_distance = (
+            (Profile.latitude - latitude) * (Profile.latitude - latitude)
+            + (Profile.longitude - longitude) * (Profile.longitude - longitude)
+        )
+        distance_expr = raw_distance.label("distance")
+        if after is not None:
+            candidates = candidates.where(
+                or_(
+                    raw_distance > after[0],
+                    and_(raw_distance == after[0], Profile.user_id > after[1])
+                )
+            )
+        row, col = geo_cell_coords(latitude, longitude)
+        max_ring = geo_max_ring(row, col)
+
+        ring = 0
+        while True:
+            cell_filter = or_(*[
+                Profile.geo_cell.between(lo, hi) for lo, hi in geo_ring_cell_ranges(row, col, ring)
+            ])
+            ring_query = (
+                candidates.add_columns(distance_expr)
+                .where(cell_filter)
+                .order_by(distance_expr.asc(), Profile.user_id.asc())
+                .limit(limit)
+            )
+            rows = (await self.db.execute(ring_query)).all()
+
+            if ring >= max_ring:
+                return [(r.user_id, r.distance) for r in rows]
+            if len(rows) == limit and rows[-1].distance <= geo_ring_reach(latitude, longitude, ring) ** 2:
+                return [(r.user_id, r.distance) for r in rows]
+            ring = min(max(1, ring * 2), max_ring)
+
+    async def get_discover_candidates(
         self,
         current_user_id: uuid.UUID,
         user_gender: str,
@@ -141,68 +266,168 @@ class UserService:
         limit: int = 20,
         user_latitude: float | None = None,
         user_longitude: float | None = None,
-    ):
+        after: tuple[float, uuid.UUID] | None = None,
+    ) -> list[tuple[uuid.UUID, float]]:
+        """
+        Ranked discover candidates as (user_id, score) pairs, ordered by (score, user_id).
+        The score is the squared distance when the user's location is known, otherwise 0.
+        `after` continues from a keyset position returned by a previous page.
+        """
         from datetime import datetime, date
-        from sqlalchemy import and_, or_, not_
-        from sqlalchemy.orm import selectinload
+        from sqlalchemy import and_, or_
         from models.like import Like
+        from models.user_pass import UserPass
         from models.block import Block
+        from services.exclusion_filter import ExclusionFilter
         
         current_year = datetime.now().year
         min_birth_date = date(current_year - max_age, 1, 1)
         max_birth_date = date(current_year - min_age, 12, 31)
         
-        liked_subq = select(Like.to_user_id).where(Like.from_user_id == current_user_id)
-        blocked_subq = select(Block.blocked_id).where(Block.blocker_id == current_user_id)
-        blocker_subq = select(Block.blocker_id).where(Block.blocked_id == current_user_id)
-        
-        query = (
-            select(Profile)
+        # Candidate selection only touches ids; full rows are loaded for the page being served
+        candidates = (
+            select(Profile.user_id)
             .join(User, Profile.user_id == User.id)
-            .options(selectinload(Profile.user).selectinload(User.photos))
             .where(
                 and_(
                     Profile.user_id != current_user_id,
                     User.is_active == True,
                     User.is_shadowbanned == False,
-                    Profile.birth_date.between(min_birth_date, max_birth_date),
-                    Profile.user_id.not_in(liked_subq),
-                    Profile.user_id.not_in(blocked_subq),
-                    Profile.user_id.not_in(blocker_subq)
+                    Profile.birth_date.between(min_birth_date, max_birth_date)
                 )
             )
         )
         
         # Filter 1: The candidate matches what the current user is looking for
         if interested_in != "Everyone":
-            query = query.where(Profile.gender == interested_in)
+            candidates = candidates.where(Profile.gender == interested_in)
 
         # Filter 2: The candidate is looking for people like the current user
-        query = query.where(
+        candidates = candidates.where(
             or_(
                 Profile.interested_in == user_gender,
                 Profile.interested_in == "Everyone"
             )
         )
 
+        excluded = await ExclusionFilter(self.db).load(current_user_id)
+        if excluded is None:
+            # Redis unavailable: exclude liked/passed/blocked users in SQL
+            liked_subq = select(Like.to_user_id).where(Like.from_user_id == current_user_id)
+            passed_subq = select(UserPass.to_user_id).where(UserPass.from_user_id == current_user_id)
+            blocked_subq = select(Block.blocked_id).where(Block.blocker_id == current_user_id)
+            blocker_subq = select(Block.blocker_id).where(Block.blocked_id == current_user_id)
+            candidates = candidates.where(
+                Profile.user_id.not_in(liked_subq),
+                Profile.user_id.not_in(passed_subq),
+                Profile.user_id.not_in(blocked_subq),
+                Profile.user_id.not_in(blocker_subq)
+            )
+            return await self._rank_candidates(candidates, limit, after, user_latitude, user_longitude)
+
+        # Over-fetch keyset batches and drop excluded users in-process
+        batch_limit = limit + min(len(excluded), DISCOVER_MAX_OVERFETCH)
+        ranked = []
+        while len(ranked) < limit:
+            batch = await self._rank_candidates(candidates, batch_limit, after, user_latitude, user_longitude)
+            ranked.extend(entry for entry in batch if entry[0] not in excluded)
+            if len(batch) < batch_limit:
+                break
+            after = (batch[-1][1], batch[-1][0])
+        return ranked[:limit]
+
+    async def _rank_candidates(
+        self,
+        candidates,
+        limit: int,
+        after: tuple[float, uuid.UUID] | None,
+        user_latitude: float | None,
+        user_longitude: float | None,
+    ) -> list[tuple[uuid.UUID, float]]:
         # If we know the current user's location, sort candidates by nearest first
         if user_latitude is not None and user_longitude is not None:
-            distance_expr = (
-                (Profile.latitude - user_latitude) * (Profile.latitude - user_latitude)
-                + (Profile.longitude - user_longitude) * (Profile.longitude - user_longitude)
+            return await self._nearest_candidates(candidates, user_latitude, user_longitude, limit, after)
+
+        if after is not None:
+            candidates = candidates.where(Profile.user_id > after[1])
+        user_ids = (await self.db.execute(candidates.order_by(Profile.user_id).limit(limit))).scalars().all()
+        return [(user_id, 0.0) for user_id in user_ids]
+
+    async def get_profiles_by_user_ids(self, user_ids: list[uuid.UUID]) -> list[dict]:
+        """
+        Loads profiles (with photos) for the given users as plain dicts shaped like
+        ProfileResponse, preserving the input order.
+        Users deactivated or shadowbanned since they were ranked are dropped.
+        """
+        if not user_ids:
+            return []
+
+        result = await self.db.execute(
+            _profile_row_query()
+            .join(User, Profile.user_id == User.id)
+            .where(
+                Profile.user_id.in_(user_ids),
+                User.is_active == True,
+                User.is_shadowbanned == False,
             )
-            query = query.where(
-                Profile.latitude.is_not(None),
-                Profile.longitude.is_not(None),
-            ).order_by(distance_expr.asc())
-            
-        query = query.limit(limit)
-        result = await self.db.execute(query)
-        profiles = result.scalars().all()
-        
-        # Hydrate the photos property from the loaded user relationship 
-        # so the Pydantic ProfileResponse can serialize it correctly
-        for profile in profiles:
-            setattr(profile, 'photos', getattr(profile.user, 'photos', []))
-            
-        return profiles
+        )
+        profiles_by_user = {row.user_id: dict(row._mapping) for row in result.all()}
+        return [profiles_by_user[uid] for uid in user_ids if uid in profiles_by_user]
+
+    async def get_discover_feed(
+        self,
+        current_user_id: uuid.UUID,
+        user_gender: str,
+        interested_in: str,
+        min_age: int = 18,
+        max_age: int = 100,
+        limit: int = 20,
+        user_latitude: float | None = None,
+        user_longitude: float | None = None,
+        cursor: str | None = None,
+    ) -> tuple[list[dict], str | None]:
+        """
+        One page of the discover feed plus the opaque cursor for the next page
+        (None once the feed is exhausted).
+        """
+        from services.discover_queue import DiscoverQueue
+        from utils.pagination import encode_cursor, decode_cursor
+
+        after = None
+        if cursor:
+            source, score, after_user_id = decode_cursor(cursor, 3)
+            if source not in ("queue", "db"):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            try:
+                after = (source, float(score), uuid.UUID(after_user_id))
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        params = {
+            "user_gender": user_gender,
+            "interested_in": interested_in,
+            "min_age": min_age,
+            "max_age": max_age,
+            "user_latitude": user_latitude,
+            "user_longitude": user_longitude,
+        }
+        # Served from the user's precomputed, compatibility-ranked queue when available
+        ranked = await DiscoverQueue(self.db).read(current_user_id, params, limit, after)
+        if ranked is None:
+            # Without Redis the feed is distance-ordered; a queue cursor can't be
+            # mapped onto that order, so it restarts from the nearest candidates
+            db_after = (after[1], after[2]) if after is not None and after[0] == "db" else None
+            ranked = [
+                ("db", user_id, score)
+                for user_id, score in await self.get_discover_candidates(
+                    current_user_id, limit=limit, after=db_after, **params
+                )
+            ]
+
+        next_cursor = None
+        if len(ranked) == limit:
+            last_source, last_user_id, last_score = ranked[-1]
+            next_cursor = encode_cursor(last_source, last_score, str(last_user_id))
+
+        profiles = await self.get_profiles_by_user_ids([user_id for _, user_id, _ in ranked])
+        return profiles, next_cursor
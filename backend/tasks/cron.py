@@ -1,4 +1,5 @@
 import asyncio
+from datetime import date
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -6,6 +7,10 @@ from sqlalchemy.future import select
 from config.database import AsyncSessionLocal
 from models.match import Match
 from services.compatibility_service import CompatibilityService
+from services.streak_service import StreakService, activity_gate
+from services.exclusion_filter import ExclusionFilter
+from config.redis import get_redis_pool
+import uuid
 
 scheduler = AsyncIOScheduler()
 
@@ -48,10 +53,64 @@ async def recalculate_match_scores():
             
     print("[CRON] Compatibility scoring completed.")
 
+async def flush_daily_activity():
+    """
+    Background Task:
+    Drains users first seen active since the last run (see DailyActivityGate)
+    and applies their streak updates in bulk. Days are drained oldest first, so
+    late flushes still extend streaks in the right order; if a day fails, later
+    days wait for the next run rather than being applied ahead of it.
+    """
+    today = date.today()
+    batch_size = 1000
+
+    async with AsyncSessionLocal() as db:
+        service = StreakService(db)
+        for day in activity_gate.pending_days(today):
+            while True:
+                user_ids = await activity_gate.pop_pending(day, batch_size)
+                if not user_ids:
+                    break
+                try:
+                    await service.apply_daily_activity(user_ids, day)
+                except Exception as e:
+                    await db.rollback()
+                    activity_gate.requeue(day, user_ids)
+                    print(f"[CRON] Streak flush failed for {len(user_ids)} users on {day}: {e}")
+                    return
+
+async def verify_exclusion_sets():
+    """
+    Background Task:
+    Spot-checks the discover exclusion sets of a sample of today's active users
+    against the likes/blocks tables and repairs any that drifted.
+    """
+    try:
+        redis = await get_redis_pool()
+        sample = await redis.srandmember(f"streak:seen:{date.today().isoformat()}", 50)
+    except Exception as e:
+        print(f"[CRON] Exclusion set check skipped: {e}")
+        return
+
+    mismatches = 0
+    async with AsyncSessionLocal() as db:
+        exclusion_filter = ExclusionFilter(db)
+        for user_id in sample or []:
+            try:
+                if not await exclusion_filter.check_consistency(uuid.UUID(user_id)):
+                    mismatches += 1
+            except Exception as e:
+                print(f"[CRON] Exclusion set check failed for {user_id}: {e}")
+    if mismatches:
+        print(f"[CRON] Repaired {mismatches} discover exclusion sets.")
+
 def start_scheduler():
     """
     Attaches the scheduled routines.
-    Currently configured to run 2 times a day.
+    Compatibility scoring runs 2 times a day; streak activity is flushed every minute;
+    discover exclusion sets are spot-checked every 30 minutes.
     """
     scheduler.add_job(recalculate_match_scores, 'cron', hour='3,15')
+    scheduler.add_job(flush_daily_activity, 'interval', minutes=1)
+    scheduler.add_job(verify_exclusion_sets, 'interval', minutes=30)
     scheduler.start()
@@ -0,0 +1,134 @@
+"""
+Cross-worker chat delivery: two ConnectionManagers stand in for two workers, and
+a message sent on one must reach a socket connected to the other over Redis
+pub/sub. Needs a real Redis: set REDIS_URL, e.g. redis://localhost:6379/0
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+
+from services import chat_service
+from services.chat_service import ConnectionManager, _user_channel
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+pytestmark = pytest.mark.skipif(not REDIS_URL, reason="REDIS_URL not set")
+
+class FakeWebSocket:
+    def __init__(self):
+        self.received = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: dict):
+        self.received.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed = code
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for delivery")
+        await asyncio.sleep(0.01)
+
+def _run_workers(monkeypatch, scenario):
+    import redis.asyncio as aioredis
+
+    async def run():
+        client = aioredis.from_url(REDIS_URL, decode_responses=True)
+
+        async def get_redis_pool():
+            return client
+
+        monkeypatch.setattr(chat_service, "get_redis_pool", get_redis_pool)
+        sender, receiver = ConnectionManager(), ConnectionManager()
+        listeners = [asyncio.create_task(manager.listen()) for manager in (sender, receiver)]
+        try:
+            await _wait_for(lambda: sender._pubsub is not None and receiver._pubsub is not None)
+            await scenario(client, sender, receiver)
+        finally:
+            for task in listeners:
+                task.cancel()
+            await asyncio.gather(*listeners, return_exceptions=True)
+            await client.aclose()
+
+    asyncio.run(run())
+
+async def _subscribers(client, user_id: uuid.UUID) -> int:
+    return dict(await client.pubsub_numsub(_user_channel(user_id)))[_user_channel(user_id)]
+
+async def _connect(client, manager: ConnectionManager, user_id: uuid.UUID) -> FakeWebSocket:
+    websocket = FakeWebSocket()
+    await manager.connect(user_id, websocket)
+    # SUBSCRIBE doesn't wait for Redis to confirm
+    deadline = time.monotonic() + 5
+    while not await _subscribers(client, user_id):
+        assert time.monotonic() < deadline, "subscription never registered"
+        await asyncio.sleep(0.01)
+    return websocket
+
+def test_message_reaches_a_socket_on_another_worker(monkeypatch):
+    async def scenario(client, sender, receiver):
+        user_id = uuid.uuid4()
+        websocket = await _connect(client, receiver, user_id)
+
+        await sender.send_personal_message({"type": "message", "content": "hi"}, user_id)
+        await _wait_for(lambda: websocket.received)
+        assert websocket.received == [{"type": "message", "content": "hi"}]
+        assert sender.published == 1 and sender.publish_failures == 0
+        assert receiver.delivered == 1
+
+    _run_workers(monkeypatch, scenario)
+
+def test_every_device_on_every_worker_gets_the_message(monkeypatch):
+    async def scenario(client, sender, receiver):
+        user_id = uuid.uuid4()
+        local = await _connect(client, sender, user_id)
+        remote = [await _connect(client, receiver, user_id) for _ in range(2)]
+
+        await sender.send_personal_message({"type": "message", "content": "hi"}, user_id)
+        await _wait_for(lambda: local.received and all(ws.received for ws in remote))
+        for websocket in [local, *remote]:
+            assert websocket.received == [{"type": "message", "content": "hi"}]
+
+    _run_workers(monkeypatch, scenario)
+
+def test_burst_arrives_complete_and_in_order(monkeypatch):
+    monkeypatch.setattr(chat_service.settings, "CHAT_OUTBOUND_QUEUE_SIZE", 10000)
+
+    async def scenario(client, sender, receiver):
+        user_id = uuid.uuid4()
+        websocket = await _connect(client, receiver, user_id)
+
+        count = 2000
+        for n in range(count):
+            await sender.send_personal_message({"n": n}, user_id)
+        await _wait_for(lambda: len(websocket.received) == count, timeout=30)
+        assert [message["n"] for message in websocket.received] == list(range(count))
+        assert receiver.evicted["queue_full"] == 0
+
+    _run_workers(monkeypatch, scenario)
+
+def test_last_disconnect_unsubscribes_the_worker(monkeypatch):
+    async def scenario(client, sender, receiver):
+        user_id = uuid.uuid4()
+        websocket = await _connect(client, receiver, user_id)
+        await receiver.disconnect(user_id, websocket)
+        await _wait_for(lambda: user_id not in receiver.active_connections)
+
+        deadline = time.monotonic() + 5
+        while await _subscribers(client, user_id):
+            assert time.monotonic() < deadline, "worker stayed subscribed"
+            await asyncio.sleep(0.01)
+        await sender.send_personal_message({"type": "message", "content": "hi"}, user_id)
+        await asyncio.sleep(0.1)
+        assert websocket.received == []
+
+    _run_workers(monkeypatch, scenario)
@@ -0,0 +1,118 @@
+"""
+TokenBucket tests run anywhere. The GCRA script tests need a real Redis
+(fakeredis has no Lua): set REDIS_URL, e.g. redis://localhost:6379/0
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from services import rate_limiter as rate_limiter_module
+from services.rate_limiter import RateLimiter, TokenBucket
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", fake)
+    return fake
+
+def test_token_bucket_allows_a_burst_of_limit(clock):
+    bucket = TokenBucket(limit=5, window=10)
+    assert [bucket.hit().allowed for _ in range(6)] == [True] * 5 + [False]
+
+def test_token_bucket_refills_one_token_per_interval(clock):
+    bucket = TokenBucket(limit=5, window=10)
+    for _ in range(5):
+        bucket.hit()
+    clock.now += 1.9
+    assert not bucket.hit().allowed
+    clock.now += 0.1
+    assert bucket.hit().allowed
+    assert not bucket.hit().allowed
+
+def test_token_bucket_retry_after_is_time_to_next_token(clock):
+    bucket = TokenBucket(limit=5, window=10)
+    for _ in range(5):
+        bucket.hit()
+    clock.now += 0.5
+    result = bucket.hit()
+    assert not result.allowed
+    assert result.retry_after == pytest.approx(1.5)
+
+def test_token_bucket_never_exceeds_capacity(clock):
+    bucket = TokenBucket(limit=3, window=3)
+    clock.now += 3600
+    assert [bucket.hit().allowed for _ in range(4)] == [True] * 3 + [False]
+
+requires_redis = pytest.mark.skipif(not REDIS_URL, reason="REDIS_URL not set")
+
+def _run_against_redis(scenario):
+    import redis.asyncio as aioredis
+
+    async def run():
+        client = aioredis.from_url(REDIS_URL, decode_responses=True)
+        limiter = RateLimiter()
+        limiter._script = client.register_script(rate_limiter_module._GCRA_LUA)
+        key = f"test:rate_limit:{uuid.uuid4()}"
+        try:
+            await scenario(limiter, key)
+        finally:
+            await client.delete(key)
+            await client.aclose()
+
+    asyncio.run(run())
+
+@requires_redis
+def test_gcra_allows_a_burst_of_limit():
+    async def scenario(limiter, key):
+        results = [await limiter.hit(key, limit=5, window=10) for _ in range(6)]
+        assert [result.allowed for result in results] == [True] * 5 + [False]
+
+    _run_against_redis(scenario)
+
+@requires_redis
+def test_gcra_refills_after_one_interval():
+    async def scenario(limiter, key):
+        # 5 per second: one emission interval is 200ms
+        for _ in range(5):
+            assert (await limiter.hit(key, limit=5, window=1)).allowed
+        assert not (await limiter.hit(key, limit=5, window=1)).allowed
+        await asyncio.sleep(0.25)
+        assert (await limiter.hit(key, limit=5, window=1)).allowed
+        assert not (await limiter.hit(key, limit=5, window=1)).allowed
+
+    _run_against_redis(scenario)
+
+@requires_redis
+def test_gcra_retry_after_is_time_to_next_slot():
+    async def scenario(limiter, key):
+        for _ in range(5):
+            await limiter.hit(key, limit=5, window=10)
+        result = await limiter.hit(key, limit=5, window=10)
+        assert not result.allowed
+        # The next slot opens one interval (2s) after the burst started
+        assert 1.5 < result.retry_after <= 2.0
+        await asyncio.sleep(result.retry_after + 0.05)
+        assert (await limiter.hit(key, limit=5, window=10)).allowed
+
+    _run_against_redis(scenario)
+
+@requires_redis
+def test_gcra_key_expires_once_idle():
+    async def scenario(limiter, key):
+        await limiter.hit(key, limit=5, window=10)
+        client = limiter._script.registered_client
+        # Holds only the theoretical arrival time, kept for one interval past it
+        assert 0 < await client.pttl(key) <= 2000
+
+    _run_against_redis(scenario)
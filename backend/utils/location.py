@@ -1,13 +1,68 @@
+import math
 from config.settings import settings
 
+# Fixed-size lat/long grid over the Pune bounds used to index profiles spatially.
+# ~1.1km per cell. Changing the size (or the bounds) requires re-backfilling profiles.geo_cell.
+GEO_CELL_SIZE = 0.01
+GEO_GRID_ROWS = math.ceil(round((settings.PUNE_LAT_MAX - settings.PUNE_LAT_MIN) / GEO_CELL_SIZE, 6))
+GEO_GRID_COLS = math.ceil(round((settings.PUNE_LONG_MAX - settings.PUNE_LONG_MIN) / GEO_CELL_SIZE, 6))
+
 def is_within_pune(latitude: float, longitude: float) -> bool:
     """
     Check if the given coordinates are within Pune bounds.
     """
     if latitude is None or longitude is None:
         return False
-        
+
     return (
         settings.PUNE_LAT_MIN <= latitude <= settings.PUNE_LAT_MAX and
         settings.PUNE_LONG_MIN <= longitude <= settings.PUNE_LONG_MAX
     )
+
+def geo_cell_coords(latitude: float, longitude: float) -> tuple[int, int]:
+    """
+    Grid (row, col) for a coordinate. Points outside Pune are clamped to the edge cells.
+    """
+    row = int((latitude - settings.PUNE_LAT_MIN) // GEO_CELL_SIZE)
+    col = int((longitude - settings.PUNE_LONG_MIN) // GEO_CELL_SIZE)
+    return min(max(row, 0), GEO_GRID_ROWS - 1), min(max(col, 0), GEO_GRID_COLS - 1)
+
+def geo_cell_id(latitude: float | None, longitude: float | None) -> int | None:
+    if latitude is None or longitude is None:
+        return None
+    row, col = geo_cell_coords(latitude, longitude)
+    return row * GEO_GRID_COLS + col
+
+def geo_max_ring(row: int, col: int) -> int:
+    # Smallest ring around (row, col) that covers the whole grid
+    return max(row, GEO_GRID_ROWS - 1 - row, col, GEO_GRID_COLS - 1 - col)
+
+def geo_ring_cell_ranges(row: int, col: int, ring: int) -> list[tuple[int, int]]:
+    """
+    Inclusive cell id ranges covering the square of cells within `ring` of (row, col).
+    Cell ids are row-major, so each grid row of the square is one contiguous range.
+    """
+    col_lo = max(col - ring, 0)
+    col_hi = min(col + ring, GEO_GRID_COLS - 1)
+    return [
+        (r * GEO_GRID_COLS + col_lo, r * GEO_GRID_COLS + col_hi)
+        for r in range(max(row - ring, 0), min(row + ring, GEO_GRID_ROWS - 1) + 1)
+    ]
+
+def geo_ring_reach(latitude: float, longitude: float, ring: int) -> float:
+    """
+    Distance (in degrees) from the point to the nearest edge of its ring square.
+    Every profile closer than this is guaranteed to be inside the square.
+    Edges that sit on the grid boundary don't limit the reach.
+    """
+    row, col = geo_cell_coords(latitude, longitude)
+    reach = math.inf
+    if row - ring > 0:
+        reach = min(reach, latitude - (settings.PUNE_LAT_MIN + (row - ring) * GEO_CELL_SIZE))
+    if row + ring < GEO_GRID_ROWS - 1:
+        reach = min(reach, settings.PUNE_LAT_MIN + (row + ring + 1) * GEO_CELL_SIZE - latitude)
+    if col - ring > 0:
+        reach = min(reach, longitude - (settings.PUNE_LONG_MIN + (col - ring) * GEO_CELL_SIZE))
+    if col + ring < GEO_GRID_COLS - 1:
+        reach = min(reach, settings.PUNE_LONG_MIN + (col + ring + 1) * GEO_CELL_SIZE - longitude)
+    return max(reach, 0.0)
@@ -1,12 +1,23 @@
+import asyncio
 import datetime
 import uuid
-from typing import Any, Union
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Union
+from fastapi import HTTPException, status
 from jose import jwt
 from passlib.context import CryptContext
 from config.settings import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__truncate_error=False)
 
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_hash_jobs_pending = 0
+_hash_jobs_rejected = 0
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -16,6 +27,38 @@ def get_password_hash(password: str) -> str:
         password = password[:72]
     return pwd_context.hash(password)
 
+async def _run_hash_job(func: Callable, *args) -> Any:
+    global _hash_jobs_pending, _hash_jobs_rejected
+    # Shed load instead of letting a login storm queue up unbounded work
+    if _hash_jobs_pending >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_LIMIT:
+        _hash_jobs_rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    _hash_jobs_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, partial(func, *args))
+    finally:
+        _hash_jobs_pending -= 1
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hash_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_hash_job(get_password_hash, password)
+
+def get_password_hash_stats() -> dict:
+    return {
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "queue_limit": settings.PASSWORD_HASH_QUEUE_LIMIT,
+        "pending": _hash_jobs_pending,
+        "rejected": _hash_jobs_rejected,
+    }
+
 def create_access_token(subject: Union[str, Any], role: str, expires_delta: datetime.timedelta = None) -> str:
     if expires_delta:
         expire = datetime.datetime.now(datetime.timezone.utc) + expires_delta
@@ -30,6 +30,13 @@ export function useWebSocket(matchId: string) {
         ws.onmessage = (event) => {
             try {
                 const message = JSON.parse(event.data);
+                // Server heartbeat: answer so the connection isn't evicted as idle
+                if (message.type === 'ping') {
+                    ws.send(JSON.stringify({ type: 'pong' }));
+                    return;
+                }
+                // Acks for our own sends, read receipts and error notices aren't chat messages
+                if (message.type === 'ack' || message.type === 'read' || message.error) return;
                 addChatMessage(matchId, message);
                 // If not currently on that chat page, mark unread
                 if (!window.location.pathname.includes(`/chat/${matchId}`)) {
@@ -74,7 +81,7 @@ export function useWebSocket(matchId: string) {
         addChatMessage(matchId, optimisticMessage);
 
         if (wsRef.current?.readyState === WebSocket.OPEN) {
-            wsRef.current.send(content);
+            wsRef.current.send(JSON.stringify({ type: 'message', content }));
         }
     };
 
@@ -5,5 +5,22 @@ export const chatService = {
     getMessages: async (matchId: string, offset: number = 0, limit: number = 50) => {
         const { data } = await apiClient.get<Message[]>(`/chat/${matchId}/messages?limit=${limit}&offset=${offset}`);
         return data;
+    },
+
+    // Keyset paging: `before` scrolls back, `after`/`since` fetch newer messages (oldest first)
+    getHistory: async (matchId: string, params: { before?: string, after?: string, since?: string, limit?: number } = {}) => {
+        const { data, headers } = await apiClient.get<Message[]>(`/chat/${matchId}/messages`, { params });
+        return { messages: data, nextCursor: (headers['x-next-cursor'] as string | undefined) ?? null };
+    },
+
+    // Marks the peer's messages up to and including `upToSeq` as read
+    markRead: async (matchId: string, upToSeq: number) => {
+        const { data } = await apiClient.post<{ up_to_seq: number, marked: number }>(`/chat/${matchId}/read`, { up_to_seq: upToSeq });
+        return data;
+    },
+
+    getUnreadCounts: async () => {
+        const { data } = await apiClient.get<{ total: number, matches: Record<string, number> }>('/chat/unread');
+        return data;
     }
 };
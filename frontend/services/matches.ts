@@ -15,6 +15,13 @@ export const matchService = {
         return data;
     },
 
+    swipeBatch: async (swipes: { to_user_id: string, action: 'like' | 'superlike' | 'pass' }[]) => {
+        const { data } = await apiClient.post<{ to_user_id: string, action: string, status: string, match: boolean, match_id: string | null }[]>('/matches/swipes', {
+            swipes
+        });
+        return data;
+    },
+
     blockUser: async (peerId: string) => {
         const { data } = await apiClient.post(`/matches/${peerId}/block`);
         return data;
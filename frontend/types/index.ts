@@ -60,6 +60,7 @@ export interface Message {
     sender_id: string;
     content: string;
     is_read: boolean;
+    seq?: number;
     created_at: string;
 }
 